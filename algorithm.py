@@ -1,15 +1,82 @@
 import asyncio
 import datetime
 import logging
+import random
 import re
+import secrets
+import struct
+import zlib
 
 import database as db
 import env_config
+import kinopoisk
+import recommend
+from cache import TTLCache
+from commands import ParsedCommand
 
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import (BufferedInputFile, CallbackQuery, Message, InlineKeyboardButton, InlineKeyboardMarkup,
+                           InputMediaPhoto)
 from aiohttp import TCPConnector, ClientSession
 
 
+# Общая для всех ботов процесса сессия aiohttp (Kinopoisk и Tenor), создаётся при первом запросе
+http_session = None
+
+
+def get_http_session() -> ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = ClientSession(connector=TCPConnector(ssl=False))
+    return http_session
+
+
+async def close_http_session():
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+
+
+# Общий клиент API Kinopoisk: дедлайны, хеджирование, выключатель и кэш ответов
+kinopoisk_client = kinopoisk.KinopoiskClient(
+    env_config.KINOPOISK_API_TOKEN,
+    timeout=env_config.KINOPOISK_TIMEOUT,
+    hedge=env_config.KINOPOISK_HEDGE,
+    fresh_ttl=env_config.KINOPOISK_CACHE_TTL,
+    stale_ttl=env_config.KINOPOISK_STALE_TTL,
+    session_factory=get_http_session
+)
+
+# Страницы результатов /film для листания: ключ из callback_data -> список фильмов
+film_pages = TTLCache(maxsize=env_config.FILM_PAGES_MAX, ttl=env_config.FILM_PAGES_TTL)
+
+# Фильмы по id для кнопок fm:<id> и длинные названия для кнопок fq:<ключ>
+movie_cache = TTLCache(maxsize=env_config.MOVIE_CACHE_MAX, ttl=env_config.MOVIE_CACHE_TTL)
+callback_titles = TTLCache(maxsize=env_config.CALLBACK_TITLES_MAX, ttl=env_config.CALLBACK_TITLES_TTL)
+CALLBACK_DATA_MAX = 64  # Ограничение Telegram на callback_data в байтах
+
+# /films: сколько фильмов выводить (x5 в запросе), и кэш числа результатов по фильтру для выбора страницы
+FILMS_DEFAULT = 3
+FILMS_MAX = 10
+FILMS_COUNT_PATTERN = re.compile(r"[xх](\d{1,2})", re.IGNORECASE)
+films_totals = TTLCache(maxsize=env_config.FILMS_TOTALS_MAX, ttl=env_config.FILMS_TOTALS_TTL)
+
+# /filmr рек: признаки страницы кандидатов по URL, пока сама страница лежит в кэше клиента Kinopoisk
+candidate_features = TTLCache(maxsize=env_config.FILM_PAGES_MAX, ttl=env_config.KINOPOISK_CACHE_TTL)
+
+# /filmr: попыток получить фильм, который чату ещё не предлагали, и слова режима рекомендаций
+REPEAT_ATTEMPTS = 3
+RECOMMEND_WORDS = {"рек", "rec"}
+
+# Таблицы разбора фильтров строятся один раз при импорте, а не на каждое сообщение
+MEDIA_TYPES_BY_NAME = {name.lower(): media_type for media_type, name in db.VALID_MEDIA_TYPES.items()}
+GENRES_BY_LOWER = {genre.lower(): genre for genre in db.VALID_GENRES}
+COUNTRIES_BY_WORD = {}  # слово названия страны (> 2 символов) -> список стран
+for _country in sorted(db.VALID_COUNTRIES):
+    for _word in {word.lower() for word in _country.split() if len(word) > 2}:
+        COUNTRIES_BY_WORD.setdefault(_word, []).append(_country)
+
+
 async def send_and_delete(message, text=None, timeout=15, reply=False):
     """
     Отправляет сообщение или отвечает на него, и удаляет через timeout.
@@ -30,12 +97,9 @@ async def send_and_delete(message, text=None, timeout=15, reply=False):
         await message.delete()
 
 
-async def variables_films_logic(message):
+async def variables_films_logic(parsed: ParsedCommand):
     """ Логика переменных фильмов. """
-    variables = re.sub(rf"^/(filmr|films)({env_config.BOT_USERNAME})?\s*", "", message.text) \
-        .replace(",", " ") \
-        .strip() \
-        .split()
+    variables = parsed.tokens
 
     try:
         current_year = datetime.datetime.now().year  # Текущий год
@@ -66,35 +130,26 @@ async def variables_films_logic(message):
                 year = value
 
             # Проверка типа
-            elif value_lower in {v.lower() for v in db.VALID_MEDIA_TYPES.values()}:
-                value_lower = value.lower()  # Игнорируем регистр
-                media_type = next(k for k, v in db.VALID_MEDIA_TYPES.items() if v.lower() == value_lower)
+            elif value_lower in MEDIA_TYPES_BY_NAME:
+                media_type = MEDIA_TYPES_BY_NAME[value_lower]
 
             # Проверка жанра
             if value.startswith("+") or value.startswith("-"):
                 clean_genre = value[1:].lower()  # Убираем + или - для проверки
-                if clean_genre in {genre.lower() for genre in db.VALID_GENRES}:
-                    matched_genre = next(g for g in db.VALID_GENRES if g.lower() == clean_genre)
-                    genres.append(value[0] + matched_genre)  # Сохраняем префикс + или -
+                if clean_genre in GENRES_BY_LOWER:
+                    genres.append(value[0] + GENRES_BY_LOWER[clean_genre])  # Сохраняем префикс + или -
 
-            elif value_lower in {genre.lower() for genre in db.VALID_GENRES}:
-                matched_genre = next(g for g in db.VALID_GENRES if g.lower() == value_lower)
-                genres.append(f"+{matched_genre}")  # Жанру без префикса добавляем +
+            elif value_lower in GENRES_BY_LOWER:
+                genres.append(f"+{GENRES_BY_LOWER[value_lower]}")  # Жанру без префикса добавляем +
 
             # Проверка страны
             if value.startswith("+") or value.startswith("-"):
                 clean_country = value[1:].lower()  # Убираем + или - для проверки
-                for country in db.VALID_COUNTRIES:
-                    country_words = {word.lower() for word in country.split() if
-                                     len(word) > 2}  # Учитываем слова > 2 символов
-                    if clean_country in country_words:
-                        countries.append(value[0] + country)  # Сохраняем префикс + или -
-
-            elif value_lower in {word.lower() for country in db.VALID_COUNTRIES for word in country.split() if
-                                 len(word) > 2}:
-                matched_country = next(country for country in db.VALID_COUNTRIES
-                                       if value_lower in {word.lower() for word in country.split() if len(word) > 2})
-                countries.append(f"+{matched_country}")  # Стране без префикса добавляем +
+                for country in COUNTRIES_BY_WORD.get(clean_country, []):
+                    countries.append(value[0] + country)  # Сохраняем префикс + или -
+
+            elif value_lower in COUNTRIES_BY_WORD:
+                countries.append(f"+{COUNTRIES_BY_WORD[value_lower][0]}")  # Стране без префикса добавляем +
 
         # Формируем строки для URL
         genre = "&genres.name=".join(genres) if genres else None
@@ -134,35 +189,10 @@ def make_url(url_base, rating, year, media_type, genre, country):
         return None
 
 
-async def fetch_movie_data(url):
+async def fetch_movie_data(url, cacheable=False):
     """Получает данные о фильме по-указанному URL API Kinopoisk с обработкой ошибок."""
     try:
-        headers = {"X-API-KEY": env_config.KINOPOISK_API_TOKEN}
-        async with ClientSession(connector=TCPConnector(ssl=False)) as session:
-            async with session.get(url, headers=headers) as response:
-                # logging.info(f"Отправлен запрос fetch_movie_data: {response.url}")
-
-                # Обработка статуса ответа
-                if response.status == 403:
-                    logging.error("fetch_movie_data: Достигнут лимит запросов")
-                    return {
-                        "statusCode": 403,
-                        "message": "Вы израсходовали лимит запросов. Обновите тариф.",
-                    }
-                elif response.status != 200:
-                    logging.error(f"fetch_movie_data: Ошибка при запросе. Статус: {response.status}")
-                    return None
-
-                # Проверка на JSON
-                if "application/json" in response.headers.get("Content-Type", ""):
-                    data = await response.json()
-                    if not data:  # Проверка на пустой ответ
-                        logging.error("fetch_movie_data: Пустой ответ от API")
-                        return None
-                    return data
-                else:
-                    logging.error("fetch_movie_data: Некорректный формат ответа (не JSON)")
-                    return None
+        return await kinopoisk_client.fetch(url, cacheable=cacheable)
     except Exception as err:
         logging.error(f"Неожиданная ошибка fetch_movie_data: {err}")
         return None
@@ -320,52 +350,158 @@ def format_filmr_response(data):
         return None
 
 
-async def handle_films_command(message: Message):
-    """Обработка команды /films: выводит список фильмов."""
-    rating, year, media_type, genre, country = await variables_films_logic(message)
-    url_base = "https://api.kinopoisk.dev/v1.4/movie/random?"
+CAPTION_LIMIT = 1024  # Максимальная длина подписи к фото в Telegram
 
-    data = []
-    seen_ids = set()  # Множество для уникальных ID фильмов
 
-    for attempt in range(3):  # Пытаемся получить до 3 уникальных фильмов
-        url = make_url(url_base, rating, year, media_type, genre, country)
-        logging.info("Url generated:", url)
-        movie_data = await fetch_movie_data(url)
+def make_placeholder_png(width: int = 640, height: int = 360, color: tuple = (32, 32, 32)) -> bytes:
+    """Однотонная PNG-картинка (без сторонних библиотек)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
 
-        # Проверяем, нет ли ошибки 403
-        if isinstance(movie_data, dict) and movie_data.get("statusCode") == 403:
-            await message.reply("Ошибка: вы израсходовали лимит запросов. Обновите тариф в @kinopoiskdev_bot 😢")
-            return
+    rows = b"".join(b"\x00" + bytes(color) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 9)) + chunk(b"IEND", b""))
+
+
+# Заглушка для фильмов без backdrop при листании фото-сообщения: иначе осталось бы фото предыдущего фильма.
+# file_id заглушки хранится в кэше постеров под PLACEHOLDER_KEY, файл загружается в Telegram один раз
+PLACEHOLDER_PHOTO = BufferedInputFile(make_placeholder_png(), filename="no_poster.png")
+PLACEHOLDER_KEY = "placeholder"
 
-        # Проверяем, пуст ли результат
-        if not movie_data:
-            if attempt == 0:  # Если первый запрос пустой, завершаем выполнение
-                await message.reply("Фильмы не найдены 😢")
-                return
-            continue
 
-        # Проверяем уникальность ID фильма
-        movie_id = movie_data.get("id")
-        if movie_id and movie_id not in seen_ids:
-            data.append(movie_data)
-            seen_ids.add(movie_id)
+async def reply_movie(message: Message, response: str, keyboard, movie: dict, posters=None):
+    """
+    Отвечает описанием фильма.
+
+    - Если передан кэш постеров (posters) и у фильма есть backdrop, отправляет фото с подписью.
+    - file_id фото сохраняется по id фильма, повторные отправки идут по file_id без скачивания
+      (устаревший file_id удаляется, и фото отправляется по URL заново).
+    - Если подпись длиннее CAPTION_LIMIT, отправляет фото без подписи и отдельным сообщением текст.
+    """
+    movie_info = format_movie_common(movie)
+    if posters is None or not movie_info['poster_url'] or not movie_info['title_id']:
+        await message.reply(response, reply_markup=keyboard, parse_mode="Markdown")
+        return
+
+    async def send(photo):
+        if len(response) <= CAPTION_LIMIT:
+            return await message.reply_photo(photo, caption=response, reply_markup=keyboard, parse_mode="Markdown")
+        sent_message = await message.reply_photo(photo)
+        await message.reply(response, reply_markup=keyboard, parse_mode="Markdown")
+        return sent_message
+
+    movie_id = str(movie_info['title_id'])
+    try:
+        await posters.send(movie_id, movie_info['poster_url'], send, photo_file_id)
+    except Exception as err:
+        logging.error(f"[reply_movie] Error sending poster for {movie_id}: {err}")
+        await message.reply(response, reply_markup=keyboard, parse_mode="Markdown")
+
+
+def photo_file_id(sent_message):
+    """file_id самого большого размера фото из отправленного (или отредактированного) сообщения."""
+    return sent_message.photo[-1].file_id if isinstance(sent_message, Message) and sent_message.photo else None
+
+
+def films_count(parsed: ParsedCommand) -> int:
+    """Количество фильмов для /films: токен x5 или х5 (от 1 до FILMS_MAX), по умолчанию FILMS_DEFAULT."""
+    for token in parsed.tokens:
+        if match := FILMS_COUNT_PATTERN.fullmatch(token):
+            return max(1, min(FILMS_MAX, int(match.group(1))))
+    return FILMS_DEFAULT
+
+
+async def handle_films_command(message: Message, parsed: ParsedCommand, history=None):
+    """
+    Обработка команды /films: выводит список фильмов.
+
+    Запрос к списку /v1.4/movie по фильтрам со случайной страницей: число найденных фильмов для фильтра
+    кэшируется, чтобы выбирать только среди полных страниц. Пока оно неизвестно, страница выбирается
+    среди первых FILMS_FIRST_PAGES, а если такой страницы нет - запрос повторяется по полученному total.
+    Из страницы выбираются N разных фильмов: сначала те, что чату ещё не предлагались, затем остальные.
+    """
+    rating, year, media_type, genre, country = await variables_films_logic(parsed)
+    count = films_count(parsed)
+    page_size = max(count, env_config.FILMS_PAGE_SIZE)
+    url_base = make_url(f"https://api.kinopoisk.dev/v1.4/movie?limit={page_size}&",
+                        rating, year, media_type, genre, country)
+
+    # Номер страницы: случайный среди полных страниц (неполная последняя может не вместить N фильмов),
+    # если число результатов для фильтра уже известно
+    total = films_totals.get(url_base)
+    page = random.randint(1, max(1, total // page_size)) if total is not None else \
+        random.randint(1, max(1, env_config.FILMS_FIRST_PAGES))
+    movie_data = await fetch_movie_data(f"{url_base}&page={page}")
+
+    # Проверяем, нет ли ошибки 403
+    if isinstance(movie_data, dict) and movie_data.get("statusCode") == 403:
+        await message.reply("Ошибка: вы израсходовали лимит запросов. Обновите тариф в @kinopoiskdev_bot 😢")
+        return
+
+    if movie_data and movie_data.get("total") is not None:
+        films_totals.set(url_base, movie_data["total"])
+        # Страница, выбранная наугад, оказалась неполной: берём случайную среди полных
+        full_pages = movie_data["total"] // page_size
+        if total is None and page > 1 and page > full_pages:
+            page = random.randint(1, max(1, full_pages))
+            movie_data = await fetch_movie_data(f"{url_base}&page={page}")
+
+    # Уникальные по id фильмы: сначала те, что чату ещё не предлагали, затем остальные до N
+    docs = list({movie["id"]: movie for movie in (movie_data or {}).get("docs", []) if movie.get("id")}.values())
+    unseen = history.filter_unseen(message.chat.id, docs) if history is not None else docs
+    data = random.sample(unseen, min(count, len(unseen)))
+    if len(data) < count:
+        unseen_ids = {movie["id"] for movie in unseen}
+        seen = [movie for movie in docs if movie["id"] not in unseen_ids]
+        data += random.sample(seen, min(count - len(data), len(seen)))
+    if not data:
+        await message.reply("Фильмы не найдены 😢")
+        return
+    remember_movies(data)
 
     # Формируем ответ
     response, films_keyboard = format_films_response(data)
     if response:
         await message.reply(response, reply_markup=films_keyboard, parse_mode="Markdown")
+        if history is not None:
+            history.get(message.chat.id).add(data)
     else:
         await message.reply("Фильмы не найдены 😢")
 
 
-async def handle_film_random_command(message: Message):
-    """Обработка команды /filmr: выводит случайный фильм."""
-    rating, year, media_type, genre, country = await variables_films_logic(message)
-    url_base = "https://api.kinopoisk.dev/v1.4/movie/random?"
-    url = make_url(url_base, rating, year, media_type, genre, country)
+async def handle_film_random_command(message: Message, parsed: ParsedCommand, posters=None, history=None):
+    """
+    Обработка команды /filmr: выводит случайный фильм.
 
-    data = await fetch_movie_data(url)
+    - Фильмы, которые уже предлагались чату, пропускаются (до REPEAT_ATTEMPTS попыток).
+    - Со словом «рек» фильм выбирается из страницы кандидатов по близости к истории чата.
+    """
+    rating, year, media_type, genre, country = await variables_films_logic(parsed)
+    recommend_mode = history is not None and RECOMMEND_WORDS & {token.lower() for token in parsed.tokens}
+
+    if recommend_mode:
+        url = make_url(f"https://api.kinopoisk.dev/v1.4/movie?limit={env_config.RECOMMEND_CANDIDATES}&",
+                       rating, year, media_type, genre, country)
+        candidates = await fetch_movie_data(url, cacheable=True)
+        if isinstance(candidates, dict) and candidates.get("statusCode") == 403:
+            data = candidates
+        elif candidates:
+            # Признаки считаются один раз на страницу: пока клиент отдаёт тот же объект из кэша, они верны
+            docs = candidates.get("docs", [])
+            cached = candidate_features.get(url)
+            if cached is None or cached[0] is not docs:
+                cached = (docs, recommend.movie_features(docs))
+                candidate_features.set(url, cached)
+            data = history.recommend(message.chat.id, docs, features=cached[1])
+        else:
+            data = None
+    else:
+        url = make_url("https://api.kinopoisk.dev/v1.4/movie/random?", rating, year, media_type, genre, country)
+        for _ in range(REPEAT_ATTEMPTS):
+            data = await fetch_movie_data(url)
+            if not isinstance(data, dict) or data.get("statusCode") == 403 or history is None or \
+                    history.filter_unseen(message.chat.id, [data]):
+                break
 
     # Проверяем ошибки и отсутствие данных
     if isinstance(data, dict) and data.get("statusCode") == 403:
@@ -375,41 +511,217 @@ async def handle_film_random_command(message: Message):
     if not data:
         await message.reply("Не удалось найти фильм 😢")
         return
+    remember_movies([data])
+    if history is not None:
+        history.get(message.chat.id).add([data])
 
     response, filmr_keyboard = format_filmr_response(data)
     if response:
-        await message.reply(response, reply_markup=filmr_keyboard, parse_mode="Markdown")
+        await reply_movie(message, response, filmr_keyboard, data, posters)
     else:
         await message.reply("Ошибка при форматировании фильма 😢")
 
 
-async def handle_film_title_command(message: Message):
-    """Обработка команды /film: поиск фильма по запросу."""
-    query = re.sub(rf"^/film({env_config.BOT_USERNAME})?\s*", "", message.text)
-    url = f"https://api.kinopoisk.dev/v1.4/movie/search?query={query}"
+def add_page_buttons(keyboard: InlineKeyboardMarkup, key: str, index: int, total: int) -> InlineKeyboardMarkup:
+    """Добавляет к клавиатуре фильма кнопки «предыдущий/следующий результат» поиска."""
+    if total > 1:
+        keyboard.inline_keyboard.append([
+            InlineKeyboardButton(text="◀️", callback_data=f"fp:{key}:{(index - 1) % total}"),
+            InlineKeyboardButton(text=f"{index + 1}/{total}", callback_data="fp:noop"),
+            InlineKeyboardButton(text="▶️", callback_data=f"fp:{key}:{(index + 1) % total}")
+        ])
+    return keyboard
+
+
+def format_film_caption(movie: dict):
+    """Как format_film_response, но описание обрезается, чтобы текст поместился в подпись к фото."""
+    response, keyboard = format_film_response(movie)
+    if response and len(response) > CAPTION_LIMIT:
+        description = movie.get("description") or ""
+        cut = max(0, len(description) - (len(response) - CAPTION_LIMIT) - 1)
+        response, keyboard = format_film_response({**movie, "description": description[:cut] + "…"})
+    return response, keyboard
+
+
+async def send_film_search(message: Message, query: str, posters=None):
+    """Ищет фильм по названию и отвечает на message первым результатом. Возвращает найденный фильм или None."""
+    url = f"https://api.kinopoisk.dev/v1.4/movie/search?query={query}&limit={env_config.FILM_SEARCH_LIMIT}"
     logging.info(f'Generated link {url}')
 
-    data = await fetch_movie_data(url)
-    if not data or data['total'] == 0:
+    data = await fetch_movie_data(url, cacheable=True)
+    if not data or data.get('total', 0) == 0 or not data.get('docs'):
         await message.reply("Фильм не найден 😢")
+        return None
+
+    # Вся страница результатов сохраняется, листание идёт по ней без новых запросов к API
+    docs = data['docs']
+    remember_movies(docs)
+    key = secrets.token_urlsafe(6)
+    if len(docs) > 1:
+        film_pages.set(key, docs)
+
+    # Если уйдёт фото, текст обрезается до подписи, чтобы кнопки листания были на самом фото-сообщении
+    with_photo = posters is not None and format_movie_common(docs[0])['poster_url']
+    response, films_keyboard = (format_film_caption if with_photo else format_film_response)(docs[0])
+    if response:
+        add_page_buttons(films_keyboard, key, 0, len(docs))
+        await reply_movie(message, response, films_keyboard, docs[0], posters)
+        return docs[0]
+    await message.reply("Ошибка при форматировании фильма 😢")
+    return None
+
+
+async def handle_film_title_command(message: Message, parsed: ParsedCommand, posters=None):
+    """Обработка команды /film: поиск фильма по запросу."""
+    await send_film_search(message, parsed.args, posters)
+
+
+async def handle_film_page_callback(callback_query: CallbackQuery, posters=None):
+    """Листание результатов /film: редактирует сообщение, беря фильм из сохранённой страницы поиска."""
+    if callback_query.data == "fp:noop":
+        await callback_query.answer()
         return
 
-    response, films_keyboard = format_film_response(data)
+    _, key, index = callback_query.data.split(":")
+    docs = film_pages.get(key)
+    if docs is None:
+        await callback_query.answer("Результаты поиска устарели, повторите /film")
+        return
+    index = int(index) % len(docs)
+    movie = docs[index]
+    message = callback_query.message
+
+    try:
+        if message.photo:
+            response, keyboard = format_film_caption(movie)
+            add_page_buttons(keyboard, key, index, len(docs))
+            movie_info = format_movie_common(movie)
+
+            async def edit(photo):
+                media = InputMediaPhoto(media=photo, caption=response, parse_mode="Markdown")
+                return await message.edit_media(media, reply_markup=keyboard)
+
+            photo_key = str(movie_info['title_id']) if movie_info['poster_url'] else PLACEHOLDER_KEY
+            source = movie_info['poster_url'] or PLACEHOLDER_PHOTO
+            if posters is not None:
+                await posters.send(photo_key, source, edit, photo_file_id)
+            else:
+                await edit(source)
+        else:
+            response, keyboard = format_film_response(movie)
+            add_page_buttons(keyboard, key, index, len(docs))
+            await message.edit_text(response, reply_markup=keyboard, parse_mode="Markdown")
+    except Exception as err:
+        logging.error(f"[handle_film_page_callback] Error editing message: {err}")
+    await callback_query.answer()
+
+
+def remember_movies(movies: list):
+    """Сохраняет фильмы в кэш по id, чтобы кнопки fm:<id> открывались без запроса к API."""
+    for movie in movies:
+        if movie and movie.get("id"):
+            movie_cache.set(movie["id"], movie)
+
+
+def movie_callback_data(movie_id: int) -> str:
+    """callback_data кнопки, открывающей фильм по id Кинопоиска."""
+    return f"fm:{movie_id}"
+
+
+def query_callback_data(title: str) -> str:
+    """
+    callback_data кнопки, открывающей фильм по названию (после первого нажатия кнопка переводится на fm:<id>).
+
+    Если '/film <название>' помещается в 64 байта, название передаётся прямо в кнопке.
+    Длинное название хранится в кэше под коротким ключом (fq:<ключ>), такая кнопка действует CALLBACK_TITLES_TTL.
+    """
+    callback_data = f"/film {title}"
+    if len(callback_data.encode("utf-8")) <= CALLBACK_DATA_MAX:
+        return callback_data
+    key = secrets.token_urlsafe(6)
+    callback_titles.set(key, {"title": title, "movie_id": None})
+    return f"fq:{key}"
+
+
+async def get_movie_by_id(movie_id: int):
+    """Фильм из кэша или из /movie/{id}."""
+    movie = movie_cache.get(movie_id)
+    if movie is None:
+        movie = await fetch_movie_data(f"https://api.kinopoisk.dev/v1.4/movie/{movie_id}", cacheable=True)
+        if not movie or movie.get("statusCode") == 403:
+            return None
+        remember_movies([movie])
+    return movie
+
+
+async def pin_movie_button(callback_query: CallbackQuery, movie_id: int):
+    """Заменяет в сообщении нажатую кнопку поиска по названию на кнопку fm:<id> найденного фильма."""
+    message = callback_query.message
+    markup = getattr(message, "reply_markup", None)
+    if markup is None or not markup.inline_keyboard:
+        return
+    inline_keyboard = [
+        [button.model_copy(update={"callback_data": movie_callback_data(movie_id)})
+         if button.callback_data == callback_query.data else button for button in row]
+        for row in markup.inline_keyboard
+    ]
+    try:
+        await message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=inline_keyboard))
+    except Exception as err:
+        logging.warning(f"[pin_movie_button] Can't edit buttons: {err}")
+
+
+async def handle_movie_callback(callback_query: CallbackQuery, posters=None):
+    """
+    Кнопки фильмов: отвечает описанием фильма на сообщение с кнопкой.
+
+    - fm:<id> - фильм берётся из кэша или из /movie/{id}.
+    - /film <название> и fq:<ключ> (название в кэше) - поиск по названию только при первом нажатии:
+      затем кнопка в сообщении заменяется на fm:<id> найденного фильма.
+    """
+    await callback_query.answer()  # Сразу отвечаем Telegram, чтобы у пользователя не висели «часики»
+    data = callback_query.data
+    message = callback_query.message
+
+    if data.startswith("fm:"):
+        movie_id = int(data.removeprefix("fm:"))
+    else:
+        entry = callback_titles.get(data.removeprefix("fq:")) if data.startswith("fq:") else \
+            {"title": data.removeprefix("/film").strip(), "movie_id": None}
+        if entry is None:
+            await message.reply("Кнопка устарела, воспользуйтесь /film название")
+            return
+        if not entry["title"]:
+            return
+        if entry["movie_id"] is None:
+            movie = await send_film_search(message, entry["title"], posters)
+            if movie and movie.get("id"):
+                entry["movie_id"] = movie["id"]
+                await pin_movie_button(callback_query, movie["id"])
+            return
+        movie_id = entry["movie_id"]
+
+    movie = await get_movie_by_id(movie_id)
+    if not movie:
+        await message.reply("Фильм не найден 😢")
+        return
+    response, film_keyboard = format_film_response(movie)
     if response:
-        await message.reply(response, reply_markup=films_keyboard, parse_mode="Markdown")
+        await reply_movie(message, response, film_keyboard, movie, posters)
     else:
         await message.reply("Ошибка при форматировании фильма 😢")
 
 
-async def get_random_gif(query: str):
-    """Получение случайного gif по запросу."""
+async def fetch_gif_urls(query: str, limit: int = 50) -> list:
+    """Получение пачки gif по запросу (список URL), пустой список при ошибке."""
     try:
-        url = f"https://tenor.googleapis.com/v2/search?q={query}&key={env_config.TENOR_API_KEY}&random=True&limit=1"
-        async with ClientSession(connector=TCPConnector(ssl=False)) as session:
-            async with session.get(url) as response:
-                # logging.info(f"Отправлен запрос, на gif: {response.url}")
-                data = await response.json()
-                return data['results'][0]['media_formats']['gif']['url']
+        url = "https://tenor.googleapis.com/v2/search"
+        params = {"q": query, "key": env_config.TENOR_API_KEY, "random": "true", "limit": str(limit)}
+        async with get_http_session().get(url, params=params) as response:
+            # logging.info(f"Отправлен запрос, на gif: {response.url}")
+            data = await response.json()
+            return [result['media_formats']['gif']['url'] for result in data.get('results', [])
+                    if 'gif' in result.get('media_formats', {})]
     except Exception as err:
-        logging.error(f"[get_random_gif] Error: {err}")
-        return None
+        logging.error(f"[fetch_gif_urls] Error: {err}")
+        return []
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    - maxsize: максимальное число записей, самые давно использованные вытесняются первыми.
+    - ttl: время жизни записи в секундах (None - записи не устаревают).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу, если оно есть и не устарело."""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """Сохраняет значение, ttl переопределяет время жизни по умолчанию."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return item[1] if item is not None else default
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self) -> list:
+        """Ключи всех записей (включая ещё не удалённые устаревшие) от старых к новым."""
+        return list(self._data)
+
+    def purge_expired(self) -> int:
+        """Удаляет все устаревшие записи и возвращает их количество."""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def dump(self) -> list:
+        """Возвращает живые записи [(key, оставшийся ttl или None, value)] от старых к новым - для снимков."""
+        now = time.monotonic()
+        return [
+            (key, expires_at - now if expires_at is not None else None, value)
+            for key, (expires_at, value) in self._data.items()
+            if expires_at is None or expires_at > now
+        ]
+
+    def load(self, items: list, elapsed: float = 0):
+        """Восстанавливает записи из dump(); elapsed - сколько секунд прошло с момента снимка."""
+        now = time.monotonic()
+        for key, remaining, value in items:
+            if remaining is not None and remaining <= elapsed:
+                continue
+            self._data[key] = (now + remaining - elapsed if remaining is not None else None, value)
+            self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
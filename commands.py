@@ -0,0 +1,66 @@
+import re
+from typing import NamedTuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+COMMAND_PATTERN = re.compile(r"^/(\w+)(?:@(\w+))?(?:\s+(.*))?$", re.DOTALL)
+
+
+class ParsedCommand(NamedTuple):
+    """
+    Разобранный текст сообщения.
+
+    - command: имя команды без «/» и упоминания бота (None, если сообщение не команда).
+    - mention: упомянутый после команды бот без «@» (/film@bot -> "bot").
+    - args: текст после команды без крайних пробелов (для обычного сообщения - весь текст).
+    - tokens: args, разбитый по пробелам и запятым.
+    """
+
+    command: str = None
+    mention: str = None
+    args: str = ""
+    tokens: tuple = ()
+
+
+EMPTY_COMMAND = ParsedCommand()
+
+
+def parse_command(text: str) -> ParsedCommand:
+    """Разбирает текст сообщения заранее скомпилированным регулярным выражением."""
+    if not text:
+        return EMPTY_COMMAND
+    match = COMMAND_PATTERN.match(text)
+    if match is None:
+        args = text.strip()
+        return ParsedCommand(None, None, args, tuple(args.replace(",", " ").split()))
+    command, mention, args = match.groups()
+    args = args.strip() if args else ""
+    return ParsedCommand(command, mention, args, tuple(args.replace(",", " ").split()))
+
+
+class CommandParserMiddleware(BaseMiddleware):
+    """Outer-middleware: разбирает текст сообщения один раз и передаёт ParsedCommand обработчикам в data["parsed"]."""
+
+    async def __call__(self, handler, event, data):
+        if isinstance(event, Message):
+            data["parsed"] = parse_command(event.text)
+        return await handler(event, data)
+
+
+if __name__ == "__main__":
+    # Бенчмарк: стоимость разбора одного сообщения старым способом и через parse_command
+    import timeit
+
+    bot_username = "@KinoBot"
+    text = "/filmr@KinoBot 2-5 2009-2020 +фантастика -драма Россия, фильм"
+
+    def legacy_parse():
+        command = text.replace(bot_username, "").split()[0][1:]
+        variables = re.sub(rf"^/(filmr|films)({bot_username})?\s*", "", text).replace(",", " ").strip().split()
+        return command, variables
+
+    number = 100_000
+    for name, func in (("legacy", legacy_parse), ("parse_command", lambda: parse_command(text))):
+        seconds = timeit.timeit(func, number=number)
+        print(f"{name}: {seconds / number * 1e6:.2f} us/message")
@@ -1,3 +1,5 @@
+import copy
+import json
 import re
 import sqlite3
 
@@ -50,17 +52,51 @@ VALID_COUNTRIES = {
 }
 
 
+EMOJI_PATTERN = re.compile("[\U0001F600-\U0001F64F]")  # Регулярное выражение для проверки эмодзи
+
+
+def format_user_mention(user_id: int, custom_name: str = None, username: str = None) -> str:
+    """Build a Markdown mention of a user from the stored custom name and username."""
+    display_name = custom_name if custom_name else (username if username else str(user_id))
+    username = username if username else str(user_id)
+
+    # Форматируем упоминание пользователя
+    if EMOJI_PATTERN.search(display_name):
+        return f"{display_name} ([{username}](tg://user?id={user_id}))"
+    return f"[{display_name}](tg://user?id={user_id})"
+
+
 class Database:
-    def __init__(self, db_name='users.db'):
+    def __init__(self, db_name='users.db', persistent=False, users_table='users'):
         self.db_name = db_name
+        self.persistent = persistent
+        self.users_table = users_table
+        self._shared = {"conn": None}  # Общее для scoped-копий постоянное соединение
+
+    def scoped(self, users_table: str):
+        """Return a copy that keeps users in users_table and shares the persistent connection."""
+        clone = copy.copy(self)
+        clone.users_table = users_table
+        return clone
 
     def connect(self):
-        """Create a connection to the SQLite database."""
-        return sqlite3.connect(self.db_name)
+        """Create a connection to the SQLite database (reused when the database is persistent)."""
+        if not self.persistent:
+            return sqlite3.connect(self.db_name)
+        if self._shared["conn"] is None:
+            self._shared["conn"] = sqlite3.connect(self.db_name, check_same_thread=False)
+            self._shared["conn"].execute("PRAGMA journal_mode=WAL")
+        return self._shared["conn"]
+
+    def close(self):
+        """Close the persistent connection if it was opened."""
+        if self._shared["conn"] is not None:
+            self._shared["conn"].close()
+            self._shared["conn"] = None
 
     def create_table(self):
-        """Create the users table if it doesn't exist."""
-        query = '''CREATE TABLE IF NOT EXISTS users (
+        """Create the users, file_ids and poll tables if they don't exist."""
+        query = f'''CREATE TABLE IF NOT EXISTS {self.users_table} (
                         user_id INTEGER,
                         group_id INTEGER,
                         username TEXT,
@@ -69,6 +105,30 @@ class Database:
                         PRIMARY KEY (user_id, group_id)
                     )'''
         self.execute_query(query)
+        query = '''CREATE TABLE IF NOT EXISTS file_ids (
+                        kind TEXT,
+                        key TEXT,
+                        file_id TEXT NOT NULL,
+                        PRIMARY KEY (kind, key)
+                    )'''
+        self.execute_query(query)
+        query = '''CREATE TABLE IF NOT EXISTS polls (
+                        poll_id TEXT PRIMARY KEY,
+                        chat_id INTEGER,
+                        message_id INTEGER,
+                        question TEXT,
+                        options TEXT
+                    )'''
+        self.execute_query(query)
+        query = '''CREATE TABLE IF NOT EXISTS poll_votes (
+                        poll_id TEXT,
+                        user_id INTEGER,
+                        name TEXT,
+                        option_ids TEXT,
+                        PRIMARY KEY (poll_id, user_id)
+                    )'''
+        self.execute_query(query)
+        self.execute_query('CREATE INDEX IF NOT EXISTS polls_chat_id ON polls (chat_id)')
 
     def execute_query(self, query, params=(), fetchone=False, fetchall=False):
         """Execute a query and fetch results if needed."""
@@ -88,84 +148,140 @@ class Database:
 
     def add_user(self, user_id: int, group_id: int, username: str, custom_name: str = None, notify_watching: int = 0):
         """Check if a user exists and add them if necessary, retrieving data in one function."""
-        query = '''
-        INSERT OR IGNORE INTO users (user_id, group_id, username, custom_name, notify_watching)
+        query = f'''
+        INSERT OR IGNORE INTO {self.users_table} (user_id, group_id, username, custom_name, notify_watching)
         VALUES (?, ?, ?, ?, ?)
         '''
         self.execute_query(query, (user_id, group_id, username, custom_name, notify_watching))
 
     def delete_user(self, user_id: int, group_id: int):
         """Delete a user from the database by user_id and group_id."""
-        query = 'DELETE FROM users WHERE user_id = ? AND group_id = ?'
+        query = f'DELETE FROM {self.users_table} WHERE user_id = ? AND group_id = ?'
         self.execute_query(query, (user_id, group_id))
 
     def update_notify_watching_status(self, user_id: int, group_id: int, notify_watching: int) -> bool:
         """Update the notify_watching status for a user in a specific group."""
-        query = 'UPDATE users SET notify_watching = ? WHERE user_id = ? AND group_id = ?'
+        query = f'UPDATE {self.users_table} SET notify_watching = ? WHERE user_id = ? AND group_id = ?'
         result = self.execute_query(query, (notify_watching, user_id, group_id))
         return result is None
 
     def get_user_name(self, user_id: int, group_id: int) -> str:
         """Retrieve all users in a group except the specified user ID."""
-        query = "SELECT user_id, custom_name, username FROM users WHERE user_id = ? AND group_id = ?"
+        query = f"SELECT user_id, custom_name, username FROM {self.users_table} WHERE user_id = ? AND group_id = ?"
         user = self.execute_query(query, (user_id, group_id), fetchone=True)
 
         if user:
-            user_id, custom_name, username = user
-            display_name = custom_name if custom_name else (username if username else str(user_id))
-            dict_user = {
-                "user_id": user_id,
-                "display_name": display_name,
-                "username": username if username else str(user_id)
-            }
-
-            emoji_pattern = re.compile("[\U0001F600-\U0001F64F]")
-            if emoji_pattern.search(dict_user['display_name']):
-                return f"{dict_user['display_name']} ([{dict_user['username']}](tg://user?id={dict_user['user_id']}))"
-            else:
-                return f"[{dict_user['display_name']}](tg://user?id={dict_user['user_id']})"
+            return format_user_mention(*user)
         return str(user_id)
 
     def get_users(self, excluded_user_id: int, group_id: int, watching_only: int = 0) -> list:
         """Retrieve users in a group except for the specified user, optionally filtering by watching status."""
-        query = "SELECT user_id, custom_name, username FROM users WHERE user_id != ? AND group_id = ?"
+        query = f"SELECT user_id, custom_name, username FROM {self.users_table} WHERE user_id != ? AND group_id = ?"
 
         if watching_only:
             query += " AND notify_watching = 1"
 
         users = self.execute_query(query, (excluded_user_id, group_id), fetchall=True)
-        formatted_users = []
-        emoji_pattern = re.compile("[\U0001F600-\U0001F64F]")  # Регулярное выражение для проверки эмодзи
-
-        for user_id, custom_name, username in users:
-            display_name = custom_name if custom_name else (username if username else str(user_id))
-            formatted_user = {
-                "user_id": user_id,
-                "display_name": display_name,
-                "username": username if username else str(user_id)
-            }
-
-            # Форматируем упоминание пользователя
-            if emoji_pattern.search(formatted_user['display_name']):
-                mention = f"{formatted_user['display_name']} ([{formatted_user['username']}](tg://user?id={formatted_user['user_id']}))"
-            else:
-                mention = f"[{formatted_user['display_name']}](tg://user?id={formatted_user['user_id']})"
-
-            formatted_users.append(mention)
+        formatted_users = [format_user_mention(*user) for user in users]
 
         return formatted_users
 
     def update_custom_name(self, user_id: int, group_id: int, custom_name: str = None):
         """Установить custom_name (или удалить, если None)."""
         if custom_name is not None:
-            query = 'UPDATE users SET custom_name = ? WHERE user_id = ? AND group_id = ?'
+            query = f'UPDATE {self.users_table} SET custom_name = ? WHERE user_id = ? AND group_id = ?'
             self.execute_query(query, (custom_name, user_id, group_id))
         else:
-            query = 'UPDATE users SET custom_name = NULL WHERE user_id = ? AND group_id = ?'
+            query = f'UPDATE {self.users_table} SET custom_name = NULL WHERE user_id = ? AND group_id = ?'
             self.execute_query(query, (user_id, group_id))
 
     def get_custom_name(self, user_id: int, group_id: int):
         """Retrieve the custom name of a user."""
-        query = 'SELECT custom_name FROM users WHERE user_id = ? AND group_id = ?'
+        query = f'SELECT custom_name FROM {self.users_table} WHERE user_id = ? AND group_id = ?'
         result = self.execute_query(query, (user_id, group_id), fetchone=True)
         return result[0] if result and result[0] else None
+
+    def get_file_id(self, kind: str, key: str):
+        """Retrieve a cached Telegram file_id (kind: 'gif', 'poster', ...)."""
+        query = 'SELECT file_id FROM file_ids WHERE kind = ? AND key = ?'
+        result = self.execute_query(query, (kind, key), fetchone=True)
+        return result[0] if result else None
+
+    def set_file_id(self, kind: str, key: str, file_id: str):
+        """Save a Telegram file_id, replacing the previous one."""
+        query = 'INSERT OR REPLACE INTO file_ids (kind, key, file_id) VALUES (?, ?, ?)'
+        self.execute_query(query, (kind, key, file_id))
+
+    def delete_file_id(self, kind: str, key: str):
+        """Delete a cached Telegram file_id that is no longer usable."""
+        query = 'DELETE FROM file_ids WHERE kind = ? AND key = ?'
+        self.execute_query(query, (kind, key))
+
+    def get_group_ids(self) -> list:
+        """Retrieve ids of all groups that have users."""
+        groups = self.execute_query(f'SELECT DISTINCT group_id FROM {self.users_table}', fetchall=True) or []
+        return [group_id for group_id, in groups]
+
+    def delete_group(self, group_id: int) -> int:
+        """Delete all users of a group and return their number."""
+        try:
+            with self.connect() as conn:
+                return conn.execute(f'DELETE FROM {self.users_table} WHERE group_id = ?', (group_id,)).rowcount
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return 0
+
+    def optimize(self) -> dict:
+        """Update planner statistics (ANALYZE) and return free pages to the OS (incremental vacuum)."""
+        try:
+            conn = self.connect()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # Режим auto_vacuum существующей базы меняется только полным VACUUM (один раз)
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+            conn.execute('ANALYZE')
+            conn.commit()
+            return {"freed_pages": free_pages}
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    def add_poll(self, poll_id: str, chat_id: int, message_id: int, question: str, options: list):
+        """Save a poll created by the bot."""
+        query = 'INSERT OR REPLACE INTO polls (poll_id, chat_id, message_id, question, options) VALUES (?, ?, ?, ?, ?)'
+        self.execute_query(query, (poll_id, chat_id, message_id, question, json.dumps(options, ensure_ascii=False)))
+
+    def get_poll(self, poll_id: str):
+        """Retrieve (chat_id, message_id, question, options) of a poll or None."""
+        query = 'SELECT chat_id, message_id, question, options FROM polls WHERE poll_id = ?'
+        poll = self.execute_query(query, (poll_id,), fetchone=True)
+        return (*poll[:3], json.loads(poll[3])) if poll else None
+
+    def get_last_poll_id(self, chat_id: int):
+        """Retrieve the id of the latest poll in a chat."""
+        query = 'SELECT poll_id FROM polls WHERE chat_id = ? ORDER BY rowid DESC LIMIT 1'
+        result = self.execute_query(query, (chat_id,), fetchone=True)
+        return result[0] if result else None
+
+    def save_poll_votes(self, votes: list) -> bool:
+        """Save a batch of votes [(poll_id, user_id, name, option_ids)], empty option_ids removes the vote."""
+        saved = [(poll_id, user_id, name, ",".join(map(str, option_ids)))
+                 for poll_id, user_id, name, option_ids in votes if option_ids]
+        retracted = [(poll_id, user_id) for poll_id, user_id, _, option_ids in votes if not option_ids]
+        try:
+            with self.connect() as conn:
+                conn.executemany('INSERT OR REPLACE INTO poll_votes (poll_id, user_id, name, option_ids) '
+                                 'VALUES (?, ?, ?, ?)', saved)
+                conn.executemany('DELETE FROM poll_votes WHERE poll_id = ? AND user_id = ?', retracted)
+            return True
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return False
+
+    def get_poll_votes(self, poll_id: str) -> list:
+        """Retrieve all votes of a poll as [(user_id, name, option_ids)]."""
+        query = 'SELECT user_id, name, option_ids FROM poll_votes WHERE poll_id = ?'
+        votes = self.execute_query(query, (poll_id,), fetchall=True) or []
+        return [(user_id, name, tuple(map(int, option_ids.split(",")))) for user_id, name, option_ids in votes]
@@ -0,0 +1,74 @@
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+
+from cache import TTLCache
+
+
+class FileIdCache:
+    """
+    Кэш file_id Telegram для уже отправленных медиа (gif, постеры).
+
+    После первой отправки Telegram возвращает file_id, по которому повторная отправка
+    не требует скачивания файла с удалённого сервера. Значения держатся в ограниченном LRU,
+    а если передано хранилище (storage) - ещё и сохраняются в нём под своим kind.
+    file_id, который Telegram перестал принимать (другой бот или токен), удаляется при первой ошибке.
+    """
+
+    def __init__(self, kind: str, storage=None, maxsize: int = 10000):
+        self.kind = kind
+        self.storage = storage
+        self.memory = TTLCache(maxsize=maxsize)  # key -> file_id
+
+    async def get(self, key: str):
+        """Возвращает сохранённый file_id или None."""
+        file_id = self.memory.get(key)
+        if file_id is None and self.storage is not None:
+            try:
+                file_id = await self.storage.get_file_id(self.kind, key)
+            except Exception as err:
+                logging.error(f"[FileIdCache] Error reading {self.kind} file_id: {err}")
+                return None
+            if file_id:
+                self.memory.set(key, file_id)
+        return file_id
+
+    async def set(self, key: str, file_id: str):
+        """Запоминает file_id, полученный от Telegram."""
+        self.memory.set(key, file_id)
+        if self.storage is not None:
+            try:
+                await self.storage.set_file_id(self.kind, key, file_id)
+            except Exception as err:
+                logging.error(f"[FileIdCache] Error saving {self.kind} file_id: {err}")
+
+    async def delete(self, key: str):
+        """Забывает file_id, который Telegram больше не принимает."""
+        self.memory.pop(key)
+        if self.storage is not None:
+            try:
+                await self.storage.delete_file_id(self.kind, key)
+            except Exception as err:
+                logging.error(f"[FileIdCache] Error deleting {self.kind} file_id: {err}")
+
+    async def send(self, key: str, source, send, extract):
+        """
+        Отправляет медиа по сохранённому file_id или, если его нет, по source (URL или файл).
+
+        - send(media) - корутина отправки, extract(sent) - file_id из результата (или None).
+        - Если Telegram отклонил сохранённый file_id, он удаляется, и отправка повторяется по source.
+        - Новый file_id запоминается.
+        """
+        file_id = await self.get(key)
+        try:
+            sent = await send(file_id or source)
+        except TelegramBadRequest as err:
+            if not file_id or "not modified" in str(err):
+                raise
+            logging.warning(f"[FileIdCache] Stale {self.kind} file_id for {key} ({err}), sending again")
+            await self.delete(key)
+            file_id = None
+            sent = await send(source)
+        if not file_id and (new_file_id := extract(sent)):
+            await self.set(key, new_file_id)
+        return sent
@@ -0,0 +1,62 @@
+import asyncio
+import random
+
+import algorithm
+from cache import TTLCache
+from file_ids import FileIdCache
+
+
+class GifCache:
+    """
+    Кэш для команды /gif.
+
+    - Пулы результатов Tenor: один запрос на нормализованный запрос, дальше случайный выбор из пула до истечения TTL.
+    - file_id Telegram для каждого URL gif: повторная отправка не заставляет Telegram скачивать gif заново.
+      Если передано хранилище (storage), file_id дополнительно сохраняются в нём.
+
+    file_id действительны только для бота, который их получил, а пулы URL можно передать (pools)
+    общими для нескольких ботов процесса.
+    """
+
+    def __init__(self, storage=None, pool_size: int = 50, pool_ttl: float = 3600,
+                 max_pools: int = 512, max_file_ids: int = 10000, pools: TTLCache = None):
+        self.pool_size = pool_size
+        self.pools = pools if pools is not None else TTLCache(maxsize=max_pools, ttl=pool_ttl)  # query -> [gif_url, ...]
+        self.file_ids = FileIdCache("gif", storage, maxsize=max_file_ids)  # gif_url -> file_id
+        self._pending = {}  # query -> asyncio.Task, чтобы одновременные запросы не дублировали HTTP
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Приводит запрос к единому виду: нижний регистр, одиночные пробелы."""
+        return " ".join(query.lower().split())
+
+    async def _get_pool(self, query: str) -> list:
+        pool = self.pools.get(query)
+        if pool is not None:
+            return pool
+
+        task = self._pending.get(query)
+        if task is None:
+            task = asyncio.ensure_future(algorithm.fetch_gif_urls(query, self.pool_size))
+            self._pending[query] = task
+            task.add_done_callback(lambda _: self._pending.pop(query, None))
+        pool = await asyncio.shield(task)
+        if pool:
+            self.pools.set(query, pool)
+        return pool
+
+    async def get_random_gif(self, query: str):
+        """Возвращает случайный URL gif по запросу или None."""
+        pool = await self._get_pool(self.normalize_query(query))
+        return random.choice(pool) if pool else None
+
+    async def send_gif(self, gif_url: str, send):
+        """
+        Отправляет gif корутиной send(animation) по сохранённому file_id или по URL.
+
+        Если Telegram больше не принимает сохранённый file_id, он удаляется, gif отправляется по URL,
+        и сохраняется новый file_id.
+        """
+        return await self.file_ids.send(
+            gif_url, gif_url, send, lambda sent: sent.animation.file_id if sent.animation else None
+        )
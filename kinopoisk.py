@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+
+from aiohttp import ClientError, ClientSession, TCPConnector
+
+from cache import TTLCache
+
+
+class KinopoiskError(Exception):
+    """Ошибка сервера или сети при запросе к API Kinopoisk (учитывается выключателем)."""
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей успешных запросов для расчёта p95."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель.
+
+    - closed: запросы идут, результаты копятся в окне; при доле ошибок >= failure_rate выключатель размыкается.
+    - open: запросы сразу отклоняются open_seconds секунд.
+    - half_open: пропускается один пробный запрос; успех замыкает выключатель, ошибка снова размыкает.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30, metrics: Counter = None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.metrics = metrics if metrics is not None else Counter()
+        self.state = self.CLOSED
+        self.results = deque(maxlen=window)  # True - успех, False - ошибка
+        self.opened_at = 0.0
+        self.probe_started = None  # Время запуска пробного запроса в half_open
+
+    def _transition(self, state: str):
+        logging.warning(f"[CircuitBreaker {self.name}] {self.state} -> {state}")
+        self.metrics[f"breaker_{state}"] += 1
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        elif state == self.CLOSED:
+            self.results.clear()
+        self.probe_started = None
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            # Пробный запрос, не завершившийся за open_seconds (например, отменённый), считается потерянным
+            now = time.monotonic()
+            if self.probe_started is not None and now - self.probe_started < self.open_seconds:
+                return False
+            self.probe_started = now
+        return True
+
+    def record(self, success: bool):
+        """Учитывает результат запроса, пропущенного allow()."""
+        if self.state == self.HALF_OPEN:
+            self._transition(self.CLOSED if success else self.OPEN)
+            return
+        if self.state == self.OPEN:
+            return
+        self.results.append(success)
+        failures = self.results.count(False)
+        if len(self.results) >= self.min_calls and failures / len(self.results) >= self.failure_rate:
+            self._transition(self.OPEN)
+
+
+class KinopoiskClient:
+    """
+    Устойчивый клиент API Kinopoisk.
+
+    - Общая сессия aiohttp вместо новой на каждый запрос; session_factory позволяет использовать
+      пул соединений, общий с другими клиентами процесса (ключ API передаётся в заголовке каждого запроса).
+    - Дедлайн на весь вызов (timeout секунд), после которого пользователь получает ответ об ошибке.
+    - Хеджирование: если ответа нет дольше p95 недавних запросов, отправляется второй такой же GET,
+      используется тот ответ, что пришёл первым.
+    - Выключатель: при всплеске ошибок запросы не отправляются, а отдаются последние сохранённые ответы.
+    - Кэш ответов: fresh - отдаётся сразу для запросов с cacheable=True, stale - запасной вариант при сбоях.
+    """
+
+    def __init__(self, token: str, timeout: float = 10, hedge: bool = True, hedge_min_delay: float = 0.3,
+                 fresh_ttl: float = 600, stale_ttl: float = 86400, cache_size: int = 2048, session_factory=None):
+        self.token = token
+        self.session_factory = session_factory
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.metrics = Counter()
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker("kinopoisk", metrics=self.metrics)
+        self.fresh = TTLCache(maxsize=cache_size, ttl=fresh_ttl)  # url -> data
+        self.stale = TTLCache(maxsize=cache_size, ttl=stale_ttl)  # url -> data
+        self.session = None
+
+    def _get_session(self) -> ClientSession:
+        if self.session_factory is not None:
+            return self.session_factory()
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(connector=TCPConnector(ssl=False))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, url: str):
+        """Один GET-запрос. Ошибки сервера поднимаются как KinopoiskError, ошибки сети - как ClientError."""
+        async with self._get_session().get(url, headers={"X-API-KEY": self.token or ""}) as response:
+            # Обработка статуса ответа
+            if response.status == 403:
+                logging.error("fetch_movie_data: Достигнут лимит запросов")
+                return {
+                    "statusCode": 403,
+                    "message": "Вы израсходовали лимит запросов. Обновите тариф.",
+                }
+            elif response.status >= 500 or response.status == 429:
+                raise KinopoiskError(f"status {response.status}")
+            elif response.status != 200:
+                logging.error(f"fetch_movie_data: Ошибка при запросе. Статус: {response.status}")
+                return None
+
+            # Проверка на JSON
+            if "application/json" in response.headers.get("Content-Type", ""):
+                data = await response.json()
+                if not data:  # Проверка на пустой ответ
+                    logging.error("fetch_movie_data: Пустой ответ от API")
+                    return None
+                return data
+            else:
+                logging.error("fetch_movie_data: Некорректный формат ответа (не JSON)")
+                return None
+
+    async def _get_hedged(self, url: str):
+        """GET с хеджированием: второй запрос уходит, если первый медленнее p95."""
+        p95 = self.latency.percentile(0.95)
+        tasks = {asyncio.ensure_future(self._get(url))}
+        try:
+            if self.hedge and p95 is not None:
+                done, _ = await asyncio.wait(tasks, timeout=max(p95, self.hedge_min_delay))
+                if not done:
+                    self.metrics["hedged"] += 1
+                    tasks.add(asyncio.ensure_future(self._get(url)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _fallback(self, url: str):
+        data = self.stale.get(url)
+        if data is not None:
+            self.metrics["fallback"] += 1
+            logging.info(f"[KinopoiskClient] Serving cached response for {url}")
+        return data
+
+    async def fetch(self, url: str, cacheable: bool = False):
+        """
+        Получает данные по URL API Kinopoisk.
+
+        Возвращает JSON, {"statusCode": 403, ...} при исчерпании лимита или None.
+        cacheable=True - ответ можно отдать из кэша (поиск), для случайных фильмов - False.
+        """
+        self.metrics["requests"] += 1
+        if cacheable and (data := self.fresh.get(url)) is not None:
+            self.metrics["cache_hit"] += 1
+            return data
+
+        if not self.breaker.allow():
+            self.metrics["short_circuit"] += 1
+            return self._fallback(url)
+
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(self.timeout):
+                data = await self._get_hedged(url)
+        except TimeoutError:
+            self.metrics["timeout"] += 1
+            self.breaker.record(False)
+            logging.error(f"[KinopoiskClient] Deadline {self.timeout} s exceeded for {url}")
+            return self._fallback(url)
+        except (KinopoiskError, ClientError) as err:
+            self.metrics["failure"] += 1
+            self.breaker.record(False)
+            logging.error(f"[KinopoiskClient] Request error for {url}: {err}")
+            return self._fallback(url)
+
+        self.breaker.record(True)
+        self.latency.add(time.monotonic() - started)
+        if data and data.get("statusCode") != 403:
+            self.fresh.set(url, data)
+            self.stale.set(url, data)
+        return data
+
+    def stats(self) -> dict:
+        """Состояние клиента для логов и команды администратора."""
+        p95 = self.latency.percentile(0.95)
+        return {
+            "breaker": self.breaker.state,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "cached": len(self.stale),
+            **self.metrics
+        }
@@ -2,43 +2,169 @@ import asyncio
 import logging
 import random
 import re
+import threading
+import time
 
 from aiogram import Bot, Dispatcher, F, types
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.types import BufferedInputFile, Message, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.filters import Command, ChatMemberUpdatedFilter, LEAVE_TRANSITION
 
 import algorithm
 import database
 import env_config
-
-# Создаём Bot, Dispatcher и Database
-bot = Bot(token=env_config.TELEGRAM_BOT_TOKEN)
+import file_ids
+import gif_cache
+import maintenance
+import polls
+import profiler
+import recommend
+import scheduler
+import snapshot
+import storage
+import throttling
+from cache import TTLCache
+from commands import CommandParserMiddleware, ParsedCommand
+
+# Создаём Dispatcher и хранилище (драйвер выбирается в env_config.STORAGE_BACKEND), общие для всех ботов процесса
 app = Dispatcher()
-db = database.Database()
-db.create_table()
+db = storage.create_storage()
+gif_pools = TTLCache(maxsize=512, ttl=env_config.GIF_POOL_TTL)  # Результаты Tenor не зависят от бота
+poll_tracker = polls.PollTracker(db, max_polls=env_config.POLLS_MAX, batch_size=env_config.POLL_BATCH_SIZE)
+
+
+class BotContext:
+    """
+    Состояние одного бота процесса.
+
+    Пользователи (своя таблица в хранилище), file_id Telegram, история чатов и известные участники у каждого
+    бота свои. Сессия HTTP, клиент Kinopoisk с кэшами ответов, страницы /film и пулы gif - общие.
+    """
+
+    def __init__(self, bot: Bot, username: str = None, scope: str = ""):
+        self.bot = bot
+        self.username = f"@{username.lstrip('@')}" if username else f"@{bot.id}"
+        self.scope = scope  # "" - бот LEGACY_BOT_ID, использует прежние таблицы и разделы снимка
+        self.db = db.scoped(scope) if scope else db
+        self.gifs = gif_cache.GifCache(
+            storage=self.db if env_config.GIF_CACHE_PERSIST else None,
+            pool_size=env_config.GIF_POOL_SIZE,
+            pools=gif_pools
+        )
+        self.posters = file_ids.FileIdCache("poster", self.db) if env_config.SEND_POSTERS else None
+        self.history = recommend.HistoryStore(max_chats=env_config.HISTORY_MAX_CHATS)  # Предложенные чатам фильмы
+        self.known_members = TTLCache(maxsize=env_config.KNOWN_MEMBERS_MAX)  # (user_id, chat_id), уже добавленные в БД
+
+    def forget_group(self, group_id: int):
+        """Забывает участников и историю группы, из которой бота удалили."""
+        for member in self.known_members.keys():
+            if member[1] == group_id:
+                self.known_members.pop(member)
+        self.history.chats.pop(group_id)
+
+    def register_snapshots(self, manager: snapshot.SnapshotManager):
+        prefix = f"{self.scope}:" if self.scope else ""
+        manager.register(f"{prefix}known_members", self.known_members.dump, self.known_members.load)
+        manager.register(f"{prefix}history", self.history.chats.dump, self.history.chats.load)
+        manager.register(f"{prefix}gif_file_ids", self.gifs.file_ids.memory.dump, self.gifs.file_ids.memory.load)
+        if self.posters is not None:
+            manager.register(f"{prefix}poster_file_ids", self.posters.memory.dump, self.posters.memory.load)
+
+
+contexts = {}  # bot.id -> BotContext
+
+# Снимки кэшей для тёплого старта после перезапуска (разделы ботов добавляются в main)
+snapshots = snapshot.SnapshotManager(env_config.SNAPSHOT_PATH)
+snapshots.register("gif_pools", gif_pools.dump, gif_pools.load)
+snapshots.register("kinopoisk_fresh", algorithm.kinopoisk_client.fresh.dump, algorithm.kinopoisk_client.fresh.load)
+snapshots.register("kinopoisk_stale", algorithm.kinopoisk_client.stale.dump, algorithm.kinopoisk_client.stale.load)
+snapshots.register("films_totals", algorithm.films_totals.dump, algorithm.films_totals.load)
+snapshots.register("film_pages", algorithm.film_pages.dump, algorithm.film_pages.load)
+snapshots.register("movie_cache", algorithm.movie_cache.dump, algorithm.movie_cache.load)
+snapshots.register("callback_titles", algorithm.callback_titles.dump, algorithm.callback_titles.load)
+
+# Фоновое обслуживание: хранилище, пользователи покинутых групп, устаревшие ответы API (состояние - /jobs)
+jobs = scheduler.Scheduler(max_concurrent=env_config.MAINTENANCE_CONCURRENCY)
+group_pruner = maintenance.GroupPruner(limit=env_config.PRUNE_GROUPS_PER_RUN)
+api_caches = {
+    "kinopoisk_fresh": algorithm.kinopoisk_client.fresh,
+    "kinopoisk_stale": algorithm.kinopoisk_client.stale,
+    "films_totals": algorithm.films_totals,
+    "candidate_features": algorithm.candidate_features,
+    "film_pages": algorithm.film_pages,
+    "movie_cache": algorithm.movie_cache,
+    "callback_titles": algorithm.callback_titles,
+    "gif_pools": gif_pools,
+}
+
+
+async def prune_users_job():
+    results = {}
+    for ctx in contexts.values():
+        try:
+            results[ctx.username] = await group_pruner.prune(ctx.bot, ctx.db, ctx.forget_group)
+        except Exception as err:
+            # Ошибка одного бота не должна отменять проверку групп остальных
+            logging.error(f"[prune_users_job] Error pruning groups of {ctx.username}: {err}")
+            results[ctx.username] = {"error": str(err)}
+    return results
+
+
+async def purge_caches_job():
+    return maintenance.purge_caches(api_caches)
+
+
+jobs.add("storage", db.maintain, env_config.STORAGE_MAINTENANCE_INTERVAL, env_config.MAINTENANCE_JITTER)
+jobs.add("prune_users", prune_users_job, env_config.PRUNE_USERS_INTERVAL, env_config.MAINTENANCE_JITTER)
+jobs.add("purge_caches", purge_caches_job, env_config.CACHE_PURGE_INTERVAL, env_config.MAINTENANCE_JITTER)
+
+# Диагностика: зависания event loop отслеживаются всегда, профилировщик запускается командой /profile
+lag_monitor = profiler.LoopLagMonitor(threshold=env_config.LOOP_LAG_THRESHOLD)
+profile_lock = asyncio.Lock()
+
+
+# Передаёт обработчикам состояние бота, получившего обновление, в data["ctx"]
+async def bot_context_mw(handler, event, data: dict):
+    data["ctx"] = contexts[data["bot"].id]
+    return await handler(event, data)
+
+
+app.update.outer_middleware(bot_context_mw)
 
 
 # Функция проверяет, есть ли пользователь написавший сообщений в БД
-def user_check_message_mw(handler, event: Message, data: dict):
-    db.add_user(event.from_user.id, event.chat.id, event.from_user.username)  # Добавляет в БД если его нет
-    return handler(event, data)
+async def user_check_message_mw(handler, event: Message, data: dict):
+    ctx = data["ctx"]
+    member = (event.from_user.id, event.chat.id)
+    if member not in ctx.known_members:
+        await ctx.db.add_user(event.from_user.id, event.chat.id, event.from_user.username)  # Добавляет в БД если его нет
+        ctx.known_members.set(member, True)
+    return await handler(event, data)
 
 
 app.message.middleware(user_check_message_mw)
 
+# Текст сообщения разбирается один раз, обработчики получают ParsedCommand через data["parsed"]
+app.message.outer_middleware(CommandParserMiddleware())
+
+# Анти-флуд: лишние команды отбрасываются до фильтров, БД и запросов к API
+throttle = throttling.ThrottlingMiddleware(throttling.parse_limits(env_config.THROTTLE_LIMITS))
+app.message.outer_middleware(throttle)
+app.callback_query.outer_middleware(throttle)
+
 
 # Обработчик команд /films, /filmr, /film.
 @app.message(Command("films", "filmr", "film"))
-async def send_filtered_movie(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def send_filtered_movie(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    command = parsed.command
     logging.info(f"Get command: {command}")
     try:
         if command == "films":
-            await algorithm.handle_films_command(message)
+            await algorithm.handle_films_command(message, parsed, ctx.history)
         elif command == "filmr":
-            await algorithm.handle_film_random_command(message)
+            await algorithm.handle_film_random_command(message, parsed, ctx.posters, ctx.history)
         elif command == "film":
-            await algorithm.handle_film_title_command(message)
+            await algorithm.handle_film_title_command(message, parsed, ctx.posters)
         else:
             logging.info(f"Unknown command: {command}. Skipping...")
             return
@@ -50,8 +176,8 @@ async def send_filtered_movie(message: Message):
 
 # Функция для общего уведомления
 @app.message(Command("everyone") or F.text.contains('@all'))
-async def all_users_mention(message: Message):
-    users = db.get_users(message.from_user.id, message.chat.id)
+async def all_users_mention(message: Message, ctx: BotContext):
+    users = await ctx.db.get_users(message.from_user.id, message.chat.id)
     try:
         if users:
             response_text = f"{', '.join(users)}"
@@ -65,46 +191,43 @@ async def all_users_mention(message: Message):
         return
 
 
-# Создание кнопки для /watching если указано название фильма после команды
-@app.callback_query(F.data.startswith('/film'))
-async def emulate_user_film_command(callback_query: types.CallbackQuery):
-    logging.info(f"Emulate user film command: {callback_query.data}")
-    command_text = callback_query.data
-    # Эмулируем сообщение от пользователя
-    fake_message = types.Message(
-        message_id=callback_query.message.message_id,
-        date=callback_query.message.date,
-        chat=callback_query.message.chat,
-        from_user=callback_query.from_user,
-        text=command_text,
-    )
-    # Передаём сообщение с привязкой к боту
-    await send_filtered_movie(fake_message.as_(bot))
+# Кнопки фильмов: fm:<id>, fq:<ключ> и /film <название> (см. algorithm.handle_movie_callback)
+@app.callback_query(F.data.startswith('fm:') | F.data.startswith('fq:') | F.data.startswith('/film'))
+async def movie_callback(callback_query: types.CallbackQuery, ctx: BotContext):
+    logging.info(f"Movie callback: {callback_query.data}")
+    await algorithm.handle_movie_callback(callback_query, ctx.posters)
+
+
+# Листание результатов /film
+@app.callback_query(F.data.startswith('fp:'))
+async def film_page_callback(callback_query: types.CallbackQuery, ctx: BotContext):
+    await algorithm.handle_film_page_callback(callback_query, ctx.posters)
 
 
 # Функция для уведомления о фильме
 @app.message(Command("watching"))
-async def watching_command(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def watching_command(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    command = parsed.command
     logging.info(f"Get command: {command}")
     if not command == 'watching':
         logging.info(f"Unknown command: {command}. Skipping...")
         return
 
-    watching_name = ' '.join(message.text.split(' ')[1:])
+    watching_name = parsed.args
     inline_keyboard = (
         InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text=f"Узнать о фильме: {watching_name}", callback_data=f'/film {watching_name}')]
+                [InlineKeyboardButton(text=f"Узнать о фильме: {watching_name}",
+                                      callback_data=algorithm.query_callback_data(watching_name))]
             ]
         )
-    )
+    ) if watching_name else None
 
     user_id = message.from_user.id
     chat_id = message.chat.id
 
-    users = db.get_users(user_id, chat_id, watching_only=1)
-    requester_name = db.get_user_name(user_id, chat_id)
+    users = await ctx.db.get_users(user_id, chat_id, watching_only=1)
+    requester_name = await ctx.db.get_user_name(user_id, chat_id)
 
     try:
         if users:
@@ -115,7 +238,7 @@ async def watching_command(message: Message):
             response_text = "Список пользователей, которые хотят посмотреть кино, пуст 😔"
         logging.info(
             f"[watching_command] A watching message has been sent for {response_text if users else 'no users'}")
-        await message.answer(response_text, reply_markup=inline_keyboard if watching_name else None, parse_mode="Markdown")
+        await message.answer(response_text, reply_markup=inline_keyboard, parse_mode="Markdown")
     except Exception as err:
         logging.error(f"[watching_command] Error: {err}")
         return
@@ -123,8 +246,8 @@ async def watching_command(message: Message):
 
 # Функция для включения/отключения оповещений о начале просмотра
 @app.message(Command('watch', 'unwatch'))
-async def watch_unwatch(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def watch_unwatch(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    command = parsed.command
     logging.info(f"Get command: {command}")
     try:
         if command == 'watch':
@@ -139,7 +262,7 @@ async def watch_unwatch(message: Message):
             logging.info(f"[watch_unwatch] Unknown command: {command}. Skipping...")
             return
 
-        if db.update_notify_watching_status(message.from_user.id, message.chat.id, notify_watching):
+        if await ctx.db.update_notify_watching_status(message.from_user.id, message.chat.id, notify_watching):
             await algorithm.send_and_delete(message, success_message, reply=True)
         else:
             await algorithm.send_and_delete(message, fail_message, reply=True)
@@ -148,15 +271,19 @@ async def watch_unwatch(message: Message):
         return
 
 
+# Недопустимые символы в пользовательском имени
+INVALID_NAME_PATTERN = re.compile(r"[\\;:,?/=@&<>+$%|[\]()'\"!{}]")
+
+
 # Функция добавления/удаления пользовательского имени
 @app.message(Command("setname", "removename", "myname"))
-async def setname_remove(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def setname_remove(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    command = parsed.command
     logging.info(f"Get command: {command}")
 
     user_id = message.from_user.id
     group_id = message.chat.id
-    custom_name = ' '.join(message.text.split(' ')[1:])
+    custom_name = parsed.args
 
     try:
         if command == 'setname':
@@ -168,7 +295,7 @@ async def setname_remove(message: Message):
                 )
                 return
             # Проверка на недопустимые символы
-            if invalid_match := re.search(r"[\\;:,?/=@&<>+$%|[\]()'\"!{}]", custom_name):
+            if invalid_match := INVALID_NAME_PATTERN.search(custom_name):
                 invalid_char = invalid_match.group(0)
                 await algorithm.send_and_delete(
                     message,
@@ -184,15 +311,15 @@ async def setname_remove(message: Message):
                     reply=True
                 )
                 return
-            db.update_custom_name(user_id, group_id, custom_name)  # Сохранение имени в базе данных
+            await ctx.db.update_custom_name(user_id, group_id, custom_name)  # Сохранение имени в базе данных
             await algorithm.send_and_delete(message, f"Ваше имя *{custom_name}* сохранено", reply=True)
             return
         elif command == 'removename':
-            db.update_custom_name(user_id, group_id)
+            await ctx.db.update_custom_name(user_id, group_id)
             await algorithm.send_and_delete(message, "Ваше имя удалено", reply=True)
             return
         elif command == 'myname':
-            custom_name = db.get_custom_name(user_id, group_id)
+            custom_name = await ctx.db.get_custom_name(user_id, group_id)
             if custom_name:
                 await algorithm.send_and_delete(message, f"Ваше имя: *{custom_name}*", reply=True)
             else:
@@ -210,14 +337,14 @@ from aiogram.filters import Command
 
 # Команды случайностей
 @app.message(Command("coin", "coingirl", "randomgirl"))
-async def coin_flip(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def coin_flip(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    command = parsed.command
     logging.info(f"Get command: {command}")
 
     try:
         if command == "coin":
             result = random.choice(["Орёл", "Решка"])
-            user_name = db.get_user_name(message.from_user.id, message.chat.id)
+            user_name = await ctx.db.get_user_name(message.from_user.id, message.chat.id)
             await message.answer(f"{user_name} подбросил монетку, поймал... и там {result}", parse_mode="Markdown")
         else:
             girls = ["Даши", "Саши", "Крис"]
@@ -233,17 +360,15 @@ async def coin_flip(message: Message):
 
 
 @app.message(Command("coins"))
-async def coins_func(message: Message):
-    command = message.text.replace(f'{env_config.BOT_USERNAME}', '').split()[0][1:]
+async def coins_func(message: Message, parsed: ParsedCommand):
+    command = parsed.command
     logging.info(f"UNKNOWN COMMAND FIND NEW: {command}")
 
 
 # Команды для голосования
 @app.message(Command("vote", "poll"))
-async def vote_msg(message: Message):
-    options_text = re.sub(rf"^/(poll|vote)({env_config.BOT_USERNAME})?\s*", "",
-                          message.text).strip()  # Отделяем команду
-    options = [option.strip() for option in options_text.split(",") if
+async def vote_msg(message: Message, parsed: ParsedCommand):
+    options = [option.strip() for option in parsed.args.split(",") if
                option.strip()]  # Создаём список вариантов указанных через ","
     options = list({option.lower(): option for option in options}.values())  # Фильтр для удаления дубликатов
     if len(options) < 2:
@@ -252,23 +377,48 @@ async def vote_msg(message: Message):
     elif len(options) > 10:
         await message.answer(f"{message.from_user.username}, Вы можете добавить не более 10 вариантов в голосовании")
     else:
-        await message.answer_poll(
+        sent_message = await message.answer_poll(
             question=f'"{message.from_user.username}" предлагает проголосовать:',
             options=options, is_anonymous=False, type="regular"
         )
+        await poll_tracker.track(sent_message)
     await algorithm.send_and_delete(message, timeout=30, reply=False)
 
 
+# Голоса в опросах бота: только агрегат в памяти, запись в хранилище пачками (см. polls.PollTracker)
+@app.poll_answer()
+async def poll_answer_handler(poll_answer: types.PollAnswer):
+    poll_tracker.record(poll_answer)
+
+
+# Результаты опроса: ответом на опрос или последний опрос чата
+@app.message(Command("results"))
+async def poll_results(message: Message):
+    reply = message.reply_to_message
+    poll_id = reply.poll.id if reply and reply.poll else None
+    try:
+        state = await poll_tracker.get_state(message.chat.id, poll_id)
+        if state is None:
+            await algorithm.send_and_delete(message, "Опрос не найден 😔", reply=True)
+            return
+        await message.reply(state.format_results())
+    except Exception as err:
+        logging.error(f"[poll_results] Error: {err}")
+
+
 # Функция случайной gif
 @app.message(Command("gif"))
-async def send_random_gif(message: Message):
-    query = message.text.split(' ', 1)[1].strip() if len(message.text.split(' ', 1)) > 1 else ""
+async def send_random_gif(message: Message, parsed: ParsedCommand, ctx: BotContext):
+    query = parsed.args
     if not query:
         await message.reply("Пожалуйста, укажите запрос. Например:\n/gif cat")
         return
     try:
-        gif_url = await algorithm.get_random_gif(query)
-        await message.reply_animation(gif_url)
+        gif_url = await ctx.gifs.get_random_gif(query)
+        if not gif_url:
+            await message.reply("GIF не найдена 😢")
+            return
+        await ctx.gifs.send_gif(gif_url, message.reply_animation)
     except Exception as err:
         logging.error(f"Ошибка при получении GIF: {err}")
         await message.reply("Произошла ошибка при обработке запроса.")
@@ -276,10 +426,10 @@ async def send_random_gif(message: Message):
 
 # Помощь
 @app.message(Command("help_film", "help_film_genres", "help_film_countries"))
-async def film_command_help(message: Message):
-    if '/help_film_countries' in message.text:
+async def film_command_help(message: Message, parsed: ParsedCommand):
+    if parsed.command == 'help_film_countries':
         help_text = f'*Список доступных стран*:\n{", ".join(map(str, sorted(database.VALID_COUNTRIES)))}'
-    elif '/help_film_genres' in message.text:
+    elif parsed.command == 'help_film_genres':
         help_text = f'*Список доступных жанров*:\n{", ".join(map(str, sorted(database.VALID_GENRES)))}'
     else:
         help_text = (
@@ -292,9 +442,11 @@ async def film_command_help(message: Message):
             "/filmr - Получить информацию о случайном фильме по расширенному запросу.\n"
             "Используйте команду с необязательными фильтрами (жанр, страна, год, рейтинг). Пример:\n"
             "`/filmr 2-5 2009-2020 +фантастика -драма Россия фильм`\n"
-            "`/filmr 5 2020 +фантастика +ужасы -драма США -Россия мультфильм`\n\n"
+            "`/filmr 5 2020 +фантастика +ужасы -драма США -Россия мультфильм`\n"
+            "Добавьте слово `рек`, чтобы получить фильм, похожий на уже предложенные в этом чате.\n\n"
 
             "/films - Получите информацию о 3 случайных фильмах, соответствующих вашему расширенному запросу.\n"
+            "Количество можно изменить от 1 до 10, например `x5`.\n"
             "Используйте команду с необязательными фильтрами (жанр, страна, год, рейтинг). Пример:\n"
             "`/films 2-5 2009-2020 +фантастика -драма Россия фильм`\n"
             "`/films 5 2020 +фантастика +ужасы -драма США -Россия мультфильм`\n\n"
@@ -321,9 +473,10 @@ async def help_msg(message: Message):
     sent_message = await message.reply(
         "/everyone или @all - Уведомить всех участников\n"
         "/vote или /poll <варианты через запятую> - Создать голосование от 2 до 10 вариантов\n"
+        "/results - Результаты последнего голосования (или ответом на опрос)\n"
         "/film <название фильма> - Поиск фильма по названию\n"
         "/filmr <рейтинг, год, жанр, тип> - Поиск случайного фильма\n"
-        "/films <рейтинг, год, жанр, тип> - Поиск 10 фильмов\n"
+        "/films <рейтинг, год, жанр, тип, x количество> - Поиск до 10 случайных фильмов\n"
         "/setname <имя> - Установить кастомное имя\n"
         "/removename - Удалить кастомное имя\n"
         "/watching <название фильма> - Позвать на просмотр фильма\n"
@@ -365,9 +518,74 @@ async def delete_replied_message(message: Message):
     await message.delete()
 
 
+# Состояние клиента Kinopoisk (выключатель, задержки, счётчики). Только для администраторов!
+@app.message(Command("apistats"))
+async def api_stats(message: Message):
+    if str(message.from_user.id) not in env_config.ADMIN_USER_ID:
+        logging.warning(f'User <{message.from_user.username}> from {message.chat.id} tried to use command /apistats')
+        return
+    stats = algorithm.kinopoisk_client.stats()
+    await message.reply("\n".join(f"{key}: {value}" for key, value in stats.items()))
+
+
+# Фоновые задачи обслуживания: /jobs - состояние, /jobs <имя> - запустить сейчас. Только для администраторов!
+@app.message(Command("jobs"))
+async def maintenance_jobs(message: Message, parsed: ParsedCommand):
+    if str(message.from_user.id) not in env_config.ADMIN_USER_ID:
+        logging.warning(f'User <{message.from_user.username}> from {message.chat.id} tried to use command /jobs')
+        return
+    if parsed.args:
+        if parsed.args not in jobs.jobs:
+            await message.reply(f"Неизвестная задача, доступны: {', '.join(jobs.jobs)}")
+        elif jobs.run_now(parsed.args):
+            await message.reply(f"Задача {parsed.args} запущена")
+        else:
+            await message.reply(f"Задача {parsed.args} уже выполняется")
+        return
+    lines = []
+    for name, stats in jobs.stats().items():
+        lines.append(f"{name}: " + ", ".join(f"{key}={value}" for key, value in stats.items() if value is not None))
+    await message.reply("\n".join(lines))
+
+
+# Профилирование на N секунд (по умолчанию 10), отчёт о самых горячих функциях - файлом. Только для администраторов!
+@app.message(Command("profile"))
+async def profile_command(message: Message, parsed: ParsedCommand):
+    if str(message.from_user.id) not in env_config.ADMIN_USER_ID:
+        logging.warning(f'User <{message.from_user.username}> from {message.chat.id} tried to use command /profile')
+        return
+    if profile_lock.locked():
+        await message.reply("Профилирование уже идёт")
+        return
+    seconds = int(parsed.tokens[0]) if parsed.tokens and parsed.tokens[0].isdigit() else 10
+    seconds = max(1, min(seconds, env_config.PROFILE_MAX_SECONDS))
+
+    async with profile_lock:
+        await message.reply(f"Профилирование {seconds} с...")
+        sampler = profiler.SamplingProfiler(threading.get_ident(), interval=env_config.PROFILE_INTERVAL)
+        await asyncio.to_thread(sampler.run, seconds)
+
+    lag = lag_monitor.stats()
+    locations = "\n".join(f"{count:>8}  {location}" for location, count in lag.pop("locations"))
+    report = (
+        f"Profile of {seconds} s\n"
+        f"Event loop lag: {', '.join(f'{key}={value}' for key, value in lag.items())}\n{locations}\n\n"
+        f"{sampler.report()}"
+    )
+    await message.reply_document(BufferedInputFile(report.encode(), filename=f"profile_{int(time.time())}.txt"))
+
+
+# Бота удалили из группы: сразу удаляем её пользователей (остальное найдёт задача prune_users)
+@app.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=LEAVE_TRANSITION))
+async def bot_left_group(event: types.ChatMemberUpdated, ctx: BotContext):
+    deleted = await ctx.db.delete_group(event.chat.id)
+    ctx.forget_group(event.chat.id)
+    logging.info(f"[bot_left_group] {ctx.username} left {event.chat.id}, deleted {deleted} users")
+
+
 # Welcome and goodbye message
 @app.message(F.new_chat_members | F.left_chat_member)
-async def somebody_added(message: Message):
+async def somebody_added(message: Message, ctx: BotContext):
     if message.new_chat_members:
         for user in message.new_chat_members:
             if user.is_bot:
@@ -376,13 +594,15 @@ async def somebody_added(message: Message):
             #     f"Привет, [{user.full_name if user.full_name else user.username}](tg://user?id={user.id}), "
             #     f"воспользуйся командой /help, чтобы посмотреть все возможности",
             #     parse_mode="Markdown")
-            db.add_user(user.id, message.chat.id, user.username)
+            await ctx.db.add_user(user.id, message.chat.id, user.username)
+            ctx.known_members.set((user.id, message.chat.id), True)
     elif message.left_chat_member:
         left_member = message.left_chat_member
         if left_member.is_bot:
             return
         # await message.answer(f"[{left_member.full_name}](tg://user?id={left_member.id}) покинул(а) чат", parse_mode="Markdown")
-        db.delete_user(left_member.id, group_id=message.chat.id)
+        await ctx.db.delete_user(left_member.id, group_id=message.chat.id)
+        ctx.known_members.pop((left_member.id, message.chat.id))
 
 
 # Проверка наличия пользователя в базе данных
@@ -393,9 +613,32 @@ async def check_user_in_db(message: Message):
 
 
 # Основные функции запуска бота
-async def main():
+async def main(bot_configs: list = None):
+    """Запускает всех ботов из bot_configs [(токен, имя), ...] в одном event loop с общим Dispatcher."""
+    bot_configs = bot_configs or env_config.BOT_CONFIGS
+    session = AiohttpSession()  # Общий пул соединений с Telegram Bot API
+    bots = []
+    for token, username in bot_configs:
+        bot = Bot(token=token, session=session)
+        ctx = BotContext(bot, username, scope="" if bot.id == env_config.LEGACY_BOT_ID else str(bot.id))
+        ctx.register_snapshots(snapshots)
+        contexts[bot.id] = ctx
+        bots.append(bot)
+
+    snapshot_task = None
+    polls_task = None
+    jobs_task = None
+    lag_task = asyncio.create_task(lag_monitor.run())
     try:
-        await app.start_polling(bot)
+        await db.connect()
+        for ctx in contexts.values():
+            await ctx.db.create_table()
+        if env_config.SNAPSHOT_PATH:
+            snapshots.load()
+            snapshot_task = asyncio.create_task(snapshots.run_periodic(env_config.SNAPSHOT_INTERVAL))
+        polls_task = asyncio.create_task(poll_tracker.run_periodic(env_config.POLL_FLUSH_INTERVAL))
+        jobs_task = asyncio.create_task(jobs.run())
+        await app.start_polling(*bots)
     except KeyboardInterrupt:
         logging.error("Bot was stopped by the user")
     except asyncio.CancelledError:
@@ -403,8 +646,20 @@ async def main():
     except Exception as err:
         logging.error(f"Critical error: {err}", exc_info=True)
     finally:
-        logging.critical(f"Bot {env_config.BOT_USERNAME} was stopped...")
-        await bot.session.close()
+        for ctx in contexts.values():
+            logging.critical(f"Bot {ctx.username} was stopped...")
+        lag_task.cancel()
+        if jobs_task is not None:
+            jobs_task.cancel()
+        if snapshot_task is not None:
+            snapshot_task.cancel()
+            await snapshots.save_async()
+        if polls_task is not None:
+            polls_task.cancel()
+            await poll_tracker.flush()
+        await db.close()
+        await algorithm.close_http_session()
+        await session.close()
 
 
 # Запуск бота
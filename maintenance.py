@@ -0,0 +1,71 @@
+import asyncio
+import bisect
+import logging
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramMigrateToChat
+
+# Статусы участника, означающие, что бота в группе больше нет
+LEFT_STATUSES = {"left", "kicked"}
+
+
+def purge_caches(caches: dict) -> dict:
+    """Удаляет устаревшие записи из кэшей {имя: TTLCache} и возвращает число удалённых по каждому."""
+    purged = {name: cache.purge_expired() for name, cache in caches.items()}
+    return {name: count for name, count in purged.items() if count}
+
+
+class GroupPruner:
+    """
+    Удаляет пользователей групп, в которых бота больше нет.
+
+    За один запуск проверяется не больше limit групп (через getChatMember с паузой delay между запросами),
+    следующая проверка продолжается с того места, где остановилась предыдущая.
+    """
+
+    def __init__(self, limit: int = 50, delay: float = 0.2):
+        self.limit = limit
+        self.delay = delay
+        self.cursors = {}  # bot.id -> последняя проверенная группа
+
+    @staticmethod
+    async def is_member(bot, group_id: int):
+        """True/False - состоит ли бот в группе, None - выяснить не удалось."""
+        try:
+            member = await bot.get_chat_member(group_id, bot.id)
+        except TelegramForbiddenError:
+            return False
+        except TelegramMigrateToChat as err:
+            # Группа стала супергруппой: прежний id больше не используется, пользователи добавятся под новым
+            logging.info(f"[GroupPruner] Group {group_id} migrated to {err.migrate_to_chat_id}")
+            return False
+        except TelegramBadRequest as err:
+            if "chat not found" in str(err).lower():
+                return False
+            logging.warning(f"[GroupPruner] Can't check group {group_id}: {err}")
+            return None
+        except TelegramAPIError as err:
+            # TelegramRetryAfter, TelegramNetworkError и прочие - проверим при следующем проходе
+            logging.warning(f"[GroupPruner] Can't check group {group_id}: {err}")
+            return None
+        return member.status not in LEFT_STATUSES
+
+    async def prune(self, bot, storage, on_pruned=None) -> dict:
+        """Проверяет следующую порцию групп бота; on_pruned(group_id) вызывается для каждой удалённой группы."""
+        groups = sorted(group_id for group_id in await storage.get_group_ids() if group_id < 0)
+        cursor = self.cursors.get(bot.id)
+        start = bisect.bisect_right(groups, cursor) if cursor is not None else 0
+        batch = (groups[start:] + groups[:start])[:self.limit]
+
+        pruned_groups = pruned_users = 0
+        for group_id in batch:
+            try:
+                if await self.is_member(bot, group_id) is False:
+                    pruned_users += await storage.delete_group(group_id)
+                    pruned_groups += 1
+                    if on_pruned is not None:
+                        on_pruned(group_id)
+            finally:
+                # Даже если группу проверить не удалось, следующий проход начнётся со следующей
+                self.cursors[bot.id] = group_id
+            await asyncio.sleep(self.delay)
+        return {"checked": len(batch), "groups": pruned_groups, "users": pruned_users}
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from collections import Counter
+
+from cache import TTLCache
+
+RESULTS_NAMES_MAX = 15  # Сколько имён проголосовавших показывать у варианта в /results
+RESULTS_TEXT_MAX = 4096  # Ограничение Telegram на длину сообщения (в символах UTF-16)
+
+
+def telegram_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram: в кодовых единицах UTF-16."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class PollState:
+    """Агрегат одного опроса: число голосов по вариантам и выбор каждого проголосовавшего."""
+
+    __slots__ = ("chat_id", "message_id", "question", "options", "counts", "voters")
+
+    def __init__(self, chat_id: int, message_id: int, question: str, options: list):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.question = question
+        self.options = list(options)
+        self.counts = [0] * len(self.options)
+        self.voters = {}  # user_id -> (name, option_ids)
+
+    def apply(self, user_id: int, name: str, option_ids: tuple):
+        """Учитывает голос (повторный голос заменяет прежний, пустой option_ids - отзыв голоса)."""
+        _, previous = self.voters.pop(user_id, (None, ()))
+        for option_id in previous:
+            self.counts[option_id] -= 1
+        option_ids = tuple(option_id for option_id in option_ids if 0 <= option_id < len(self.options))
+        if option_ids:
+            self.voters[user_id] = (name, option_ids)
+            for option_id in option_ids:
+                self.counts[option_id] += 1
+
+    def format_results(self) -> str:
+        """
+        Текст /results не длиннее RESULTS_TEXT_MAX: если имена не помещаются, у вариантов показывается
+        меньше имён (остальные - «и ещё N»), а в крайнем случае текст обрезается.
+        """
+        for names_max in range(RESULTS_NAMES_MAX, -1, -1):
+            text = self._format_results(names_max)
+            if telegram_length(text) <= RESULTS_TEXT_MAX:
+                return text
+        # Даже без имён не помещается (очень длинные вопрос и варианты): обрезаем
+        text = text[:RESULTS_TEXT_MAX - 1]
+        while telegram_length(text) > RESULTS_TEXT_MAX - 1:
+            text = text[:-1]
+        return text + "…"
+
+    def _format_results(self, names_max: int) -> str:
+        lines = [f"📊 {self.question}"]
+        total = len(self.voters)
+        for option_id, option in enumerate(self.options):
+            count = self.counts[option_id]
+            percent = round(count * 100 / total) if total else 0
+            lines.append(f"\n{option} - {count} ({percent}%)")
+            names = [name for name, option_ids in self.voters.values() if option_id in option_ids]
+            if names and names_max:
+                more = len(names) - names_max
+                lines.append(", ".join(names[:names_max]) + (f" и ещё {more}" if more > 0 else ""))
+        lines.append(f"\nВсего проголосовало: {total}")
+        return "\n".join(lines)
+
+
+class PollTracker:
+    """
+    Учёт голосов в опросах /vote и /poll.
+
+    - poll_answer только обновляет агрегат в памяти и запоминает последний голос пользователя
+      в pending (повторные голоса одного пользователя между записями схлопываются).
+    - flush() раз в flush_interval секунд пишет накопленные голоса в хранилище пачками по batch_size
+      в одной транзакции, поэтому массовое голосование не превращается в запись на каждый голос.
+    - /results читает агрегат из памяти; опрос, вытесненный из памяти или созданный до перезапуска,
+      загружается из хранилища двумя запросами (опрос и все его голоса).
+    """
+
+    def __init__(self, storage, max_polls: int = 1000, batch_size: int = 500):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.polls = TTLCache(maxsize=max_polls)  # poll_id -> PollState
+        self.pending = {}  # (poll_id, user_id) -> (name, option_ids), ещё не записанные голоса
+        self.metrics = Counter()
+        self._flush_lock = asyncio.Lock()
+
+    async def track(self, message):
+        """Запоминает опрос, отправленный ботом (message.poll)."""
+        poll = message.poll
+        options = [option.text for option in poll.options]
+        self.polls.set(poll.id, PollState(message.chat.id, message.message_id, poll.question, options))
+        try:
+            await self.storage.add_poll(poll.id, message.chat.id, message.message_id, poll.question, options)
+        except Exception as err:
+            logging.error(f"[PollTracker] Error saving poll {poll.id}: {err}")
+
+    def record(self, poll_answer):
+        """Учитывает poll_answer: только память, запись в хранилище - в flush()."""
+        user = poll_answer.user
+        if user is None:
+            return
+        option_ids = tuple(poll_answer.option_ids)
+        state = self.polls.get(poll_answer.poll_id)
+        if state is not None:
+            state.apply(user.id, user.full_name, option_ids)
+        self.pending[(poll_answer.poll_id, user.id)] = (user.full_name, option_ids)
+        self.metrics["answers"] += 1
+
+    async def flush(self) -> int:
+        """Записывает накопленные голоса пачками, возвращает число записанных голосов."""
+        async with self._flush_lock:
+            pending, self.pending = self.pending, {}
+            votes = [(poll_id, user_id, name, option_ids) for (poll_id, user_id), (name, option_ids) in pending.items()]
+            written = 0
+            for start in range(0, len(votes), self.batch_size):
+                batch = votes[start:start + self.batch_size]
+                try:
+                    saved = await self.storage.save_poll_votes(batch)
+                except Exception as err:
+                    logging.error(f"[PollTracker] Error saving votes: {err}")
+                    saved = False
+                if not saved:
+                    # Несохранённые голоса возвращаются в очередь, если пользователь не успел проголосовать заново
+                    for poll_id, user_id, name, option_ids in votes[start:]:
+                        self.pending.setdefault((poll_id, user_id), (name, option_ids))
+                    self.metrics["flush_errors"] += 1
+                    break
+                written += len(batch)
+            if written:
+                self.metrics["votes_written"] += written
+                self.metrics["flushes"] += 1
+                logging.info(f"[PollTracker] Saved {written} votes")
+            return written
+
+    async def _load(self, poll_id: str):
+        poll = await self.storage.get_poll(poll_id)
+        if poll is None:
+            return None
+        state = PollState(*poll)
+        for user_id, name, option_ids in await self.storage.get_poll_votes(poll_id):
+            state.apply(user_id, name, option_ids)
+        self.polls.set(poll_id, state)
+        return state
+
+    async def get_state(self, chat_id: int, poll_id: str = None):
+        """Агрегат опроса poll_id или последнего опроса чата, None - опрос неизвестен."""
+        if poll_id is None:
+            poll_id = await self.storage.get_last_poll_id(chat_id)
+            if poll_id is None:
+                return None
+        state = self.polls.get(poll_id)
+        if state is None:
+            await self.flush()  # Голоса из очереди должны попасть в загружаемый из хранилища агрегат
+            state = await self._load(poll_id)
+        return state if state is not None and state.chat_id == chat_id else None
+
+    async def run_periodic(self, interval: float):
+        """Периодически записывает накопленные голоса, пока задача не будет отменена."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
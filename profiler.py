@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def is_project_file(filename: str) -> bool:
+    return filename.startswith(PROJECT_DIR) and "site-packages" not in filename
+
+
+def frame_name(frame) -> str:
+    filename = frame.f_code.co_filename
+    if is_project_file(filename):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    return f"{filename}:{frame.f_code.co_firstlineno}({frame.f_code.co_name})"
+
+
+def walk_stack(frame) -> list:
+    """Кадры стека от внутреннего (выполняется сейчас) к внешнему."""
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    return stack
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик потока event loop.
+
+    Отдельный поток каждые interval секунд снимает стек потока thread_id (sys._current_frames)
+    и считает для каждой функции собственные сэмплы (она на вершине стека) и общие (она есть в стеке).
+    Бот при этом не перезапускается, а накладные расходы ограничены частотой сэмплирования.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()  # функция -> сэмплы на вершине стека
+        self.total = Counter()  # функция -> сэмплы, где функция есть в стеке
+
+    def run(self, seconds: float):
+        """Собирает сэмплы seconds секунд (блокирующий вызов, выполняется в отдельном потоке)."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = [frame_name(item) for item in walk_stack(frame)]
+                self.samples += 1
+                self.own[stack[0]] += 1
+                self.total.update(set(stack))
+            time.sleep(self.interval)
+
+    def report(self, top: int = 40) -> str:
+        lines = [f"Samples: {self.samples} (interval {self.interval * 1000:.0f} ms)", ""]
+        for title, counter in (("Own time (top of stack)", self.own), ("Total time (in stack)", self.total)):
+            lines.append(f"{title}:")
+            lines.append(f"{'samples':>8} {'%':>6}  function")
+            for name, count in counter.most_common(top):
+                lines.append(f"{count:>8} {count * 100 / max(1, self.samples):>6.1f}  {name}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+class LoopLagMonitor:
+    """
+    Монитор задержек event loop.
+
+    - Корутина run() просыпается каждые interval секунд; если проснулась позже на threshold и больше,
+      это зависание (loop был занят блокирующим кодом): оно логируется и учитывается в stats().
+    - Сторожевой поток замечает зависание, пока оно идёт, и снимает стек потока loop: цепочку кадров
+      кода бота в выполняемой задаче (middleware и обработчик) и кадр, который выполнялся
+      (например, синхронный Database.execute_query).
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.metrics = Counter()  # stalls
+        self.locations = Counter()  # "обработчик -> место" -> число зависаний
+        self.max_lag = 0.0
+        self.heartbeat = time.monotonic()
+        self.thread_id = None
+        self._stall = None  # (обработчик, место), снятые сторожевым потоком во время текущего зависания
+        self._stop = threading.Event()
+
+    def _capture(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return None
+        stack = walk_stack(frame)
+        # Кадры ниже Handle._run - сам event loop и asyncio.run(main()), к выполняемой задаче они не относятся
+        for index, item in enumerate(stack):
+            if item.f_code.co_name == "_run" and item.f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+                stack = stack[:index]
+                break
+        if not stack:
+            return None
+        own = [frame_name(item) for item in reversed(stack) if is_project_file(item.f_code.co_filename)]
+        return " > ".join(own) or None, frame_name(stack[0])
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            if self._stall is None and time.monotonic() - self.heartbeat > self.threshold + self.interval:
+                self._stall = self._capture()
+
+    async def run(self):
+        """Следит за event loop, пока задача не будет отменена."""
+        self.thread_id = threading.get_ident()
+        self._stop.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                self.heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = time.monotonic() - self.heartbeat - self.interval
+                if lag >= self.threshold:
+                    handler, location = self._stall or (None, None)
+                    self.metrics["stalls"] += 1
+                    self.max_lag = max(self.max_lag, lag)
+                    self.locations[f"{handler} -> {location}"] += 1
+                    logging.warning(f"[LoopLagMonitor] Event loop stalled for {lag * 1000:.0f} ms "
+                                    f"in {handler}, at {location}")
+                self._stall = None
+        finally:
+            self._stop.set()
+
+    def stats(self, top: int = 10) -> dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "max_lag_ms": round(self.max_lag * 1000),
+            **self.metrics,
+            "locations": self.locations.most_common(top)
+        }
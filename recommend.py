@@ -0,0 +1,214 @@
+import datetime
+import random
+from typing import NamedTuple
+
+import numpy as np
+
+import database as db
+from cache import TTLCache
+
+# Признаки фильма: one-hot жанры, one-hot страны, рейтинг и год (нормированные в 0..1)
+GENRE_INDEX = {genre: i for i, genre in enumerate(sorted(db.VALID_GENRES))}
+COUNTRY_INDEX = {country: len(GENRE_INDEX) + i for i, country in enumerate(sorted(db.VALID_COUNTRIES))}
+RATING_COLUMN = len(GENRE_INDEX) + len(COUNTRY_INDEX)
+YEAR_COLUMN = RATING_COLUMN + 1
+FEATURES = YEAR_COLUMN + 1
+FIRST_YEAR = 1890
+
+
+class MovieFeatures(NamedTuple):
+    """
+    Признаки списка фильмов в разреженном виде (вместо плотной матрицы len(movies) x FEATURES).
+
+    - ids: id фильмов (0 - фильм без id).
+    - columns: номера one-hot столбцов (жанры и страны) всех фильмов подряд, rows - номер фильма для каждого из них.
+    - counts: число one-hot столбцов у каждого фильма.
+    - ratings, years: рейтинг и год, нормированные в 0..1.
+    """
+
+    ids: np.ndarray
+    columns: np.ndarray
+    rows: np.ndarray
+    counts: np.ndarray
+    ratings: np.ndarray
+    years: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def profile(self) -> np.ndarray:
+        """Сумма векторов признаков всех фильмов (вектор длины FEATURES)."""
+        profile = np.bincount(self.columns, minlength=FEATURES).astype(np.float32)
+        profile[RATING_COLUMN] = self.ratings.sum()
+        profile[YEAR_COLUMN] = self.years.sum()
+        return profile
+
+
+def movie_features(movies: list) -> MovieFeatures:
+    """Признаки списка фильмов из API: один проход по фильмам, дальше только векторные операции."""
+    columns, counts = [], []
+    for movie in movies:
+        row = [column for genre in movie.get("genres") or () if (column := GENRE_INDEX.get(genre.get("name"))) is not None]
+        row += [column for country in movie.get("countries") or ()
+                if (column := COUNTRY_INDEX.get(country.get("name"))) is not None]
+        columns += row
+        counts.append(len(row))
+    counts = np.array(counts, dtype=np.int32)
+    ids = np.fromiter((int(movie.get("id") or 0) for movie in movies), dtype=np.int64, count=len(movies))
+    ratings = np.fromiter(((movie.get("rating") or {}).get("kp") or 0 for movie in movies),
+                          dtype=np.float32, count=len(movies))
+    years = np.fromiter((movie.get("year") or FIRST_YEAR for movie in movies), dtype=np.float32, count=len(movies))
+    return MovieFeatures(
+        ids=ids,
+        columns=np.array(columns, dtype=np.int32),
+        rows=np.repeat(np.arange(len(movies), dtype=np.int32), counts),
+        counts=counts,
+        ratings=ratings / 10,
+        years=(years - FIRST_YEAR) / max(1, datetime.datetime.now().year - FIRST_YEAR)
+    )
+
+
+def score(features: MovieFeatures, profile: np.ndarray) -> np.ndarray:
+    """
+    Косинусная близость каждого фильма к профилю чата.
+
+    Скалярное произведение - сумма весов профиля по one-hot столбцам фильма (bincount по rows) плюс рейтинг и год;
+    норма вектора фильма - из числа one-hot столбцов (жанры и страны у фильма не повторяются), рейтинга и года.
+    """
+    dots = np.bincount(features.rows, weights=profile[features.columns], minlength=len(features))
+    dots += features.ratings * profile[RATING_COLUMN] + features.years * profile[YEAR_COLUMN]
+    norms = np.sqrt(features.counts + features.ratings ** 2 + features.years ** 2) * np.linalg.norm(profile)
+    return dots / np.maximum(norms, 1e-9)
+
+
+class BloomFilter:
+    """Компактное множество id фильмов: size бит, ложноположительные ответы возможны, ложноотрицательные - нет."""
+
+    PRIME = 2_147_483_647
+    SEEDS = ((0x9E3779B1, 0x7F4A7C15), (0x85EBCA77, 0x165667B1), (0xC2B2AE3D, 0x27D4EB2F), (0x61C88647, 0x5BD1E995))
+
+    def __init__(self, size: int = 8192):
+        self.size = size
+        self.bits = bytearray(size // 8)
+
+    def _positions(self, value: int):
+        for a, b in self.SEEDS:
+            yield ((a * value + b) % self.PRIME) % self.size
+
+    def add(self, value: int):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def contains_many(self, values: np.ndarray) -> np.ndarray:
+        """То же, что value in filter, для массива id (int64, меньше 2**31 - иначе произведение переполнится)."""
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        found = np.ones(len(values), dtype=bool)
+        for a, b in self.SEEDS:
+            positions = ((a * values + b) % self.PRIME) % self.size
+            found &= (bits[positions >> 3] & (1 << (positions & 7))) != 0
+        return found
+
+
+class ChatHistory:
+    """
+    История предложенных чату фильмов.
+
+    - seen: Bloom-фильтр id (1 КБ на чат), после capacity фильмов фильтр начинается заново.
+    - profile: сумма векторов признаков предложенных фильмов - «вкус» чата для рекомендаций.
+    """
+
+    def __init__(self, capacity: int = 1000, bloom_size: int = 8192):
+        self.capacity = capacity
+        self.seen = BloomFilter(bloom_size)
+        self.count = 0
+        self.profile = np.zeros(FEATURES, dtype=np.float32)
+
+    def is_seen(self, movie_id) -> bool:
+        return bool(movie_id) and int(movie_id) in self.seen
+
+    def seen_mask(self, ids: np.ndarray) -> np.ndarray:
+        """is_seen для массива id: True - фильм уже предлагался."""
+        return (ids > 0) & self.seen.contains_many(ids)
+
+    def add(self, movies: list):
+        movies = [movie for movie in movies if movie and movie.get("id")]
+        if not movies:
+            return
+        if self.count + len(movies) > self.capacity:
+            self.seen = BloomFilter(self.seen.size)
+            self.count = 0
+        for movie in movies:
+            self.seen.add(int(movie["id"]))
+        self.count += len(movies)
+        self.profile += movie_features(movies).profile()
+
+
+class HistoryStore:
+    """История по чатам в ограниченном LRU: давно неактивные чаты вытесняются."""
+
+    def __init__(self, max_chats: int = 10000, capacity: int = 1000):
+        self.capacity = capacity
+        self.chats = TTLCache(maxsize=max_chats)  # chat_id -> ChatHistory
+
+    def get(self, chat_id: int) -> ChatHistory:
+        history = self.chats.get(chat_id)
+        if history is None:
+            history = ChatHistory(self.capacity)
+            self.chats.set(chat_id, history)
+        return history
+
+    def filter_unseen(self, chat_id: int, movies: list) -> list:
+        history = self.chats.get(chat_id)
+        if history is None:
+            return movies
+        return [movie for movie in movies if not history.is_seen(movie.get("id"))]
+
+    def recommend(self, chat_id: int, candidates: list, top: int = 5, features: MovieFeatures = None):
+        """
+        Случайный фильм из top самых близких к профилю чата непросмотренных кандидатов.
+
+        features - заранее посчитанные movie_features(candidates): с ними выбор обходится без цикла по фильмам.
+        """
+        if not candidates:
+            return None
+        if features is None:
+            features = movie_features(candidates)
+        history = self.chats.get(chat_id)
+        unseen = np.flatnonzero(~history.seen_mask(features.ids)) if history is not None else np.arange(len(features))
+        if not len(unseen):
+            return None
+        if history is None or not history.profile.any():
+            return candidates[int(random.choice(unseen))]
+        scores = score(features, history.profile)[unseen]
+        best = unseen[np.argpartition(scores, -top)[-top:]] if len(scores) > top else unseen
+        return candidates[int(random.choice(best))]
+
+
+if __name__ == "__main__":
+    # Бенчмарк: выбор рекомендации из 100 000 кандидатов с историей чата из 500 фильмов
+    import timeit
+
+    genres, countries = sorted(GENRE_INDEX), sorted(COUNTRY_INDEX)
+    candidates = [
+        {
+            "id": movie_id,
+            "genres": [{"name": name} for name in random.sample(genres, random.randint(1, 3))],
+            "countries": [{"name": name} for name in random.sample(countries, random.randint(1, 2))],
+            "rating": {"kp": round(random.uniform(3, 9), 1)},
+            "year": random.randint(1950, 2025)
+        }
+        for movie_id in range(1, 100_001)
+    ]
+    store = HistoryStore()
+    store.get(1).add(random.sample(candidates, 500))
+    features = movie_features(candidates)
+
+    number = 20
+    for name, func in (("movie_features", lambda: movie_features(candidates)),
+                       ("recommend", lambda: store.recommend(1, candidates)),
+                       ("recommend (features)", lambda: store.recommend(1, candidates, features=features))):
+        seconds = timeit.timeit(func, number=number)
+        print(f"{name}: {seconds / number * 1000:.1f} ms per {len(candidates)} candidates")
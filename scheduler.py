@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+
+
+class Job:
+    """Периодическая задача планировщика и результат её последнего запуска."""
+
+    def __init__(self, name: str, func, interval: float, jitter: float = 0.1):
+        self.name = name
+        self.func = func  # async func() -> результат для лога и /jobs
+        self.interval = interval
+        self.jitter = jitter
+        self.running = False
+        self.last_started = None  # time.time() последнего запуска
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+        self.metrics = Counter()  # runs, errors, skipped
+
+    def next_delay(self) -> float:
+        """Интервал со случайным отклонением ±jitter, чтобы задачи разных процессов не совпадали по времени."""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "running": self.running,
+            "ago_s": round(time.time() - self.last_started) if self.last_started is not None else None,
+            "duration_ms": round(self.last_duration * 1000) if self.last_duration is not None else None,
+            "result": self.last_result,
+            "error": self.last_error,
+            **self.metrics
+        }
+
+
+class Scheduler:
+    """
+    Планировщик фоновых задач обслуживания.
+
+    - Каждая задача запускается раз в interval секунд со случайным отклонением (jitter).
+    - Защита от наложения: если предыдущий запуск задачи ещё идёт, очередной пропускается.
+    - Не больше max_concurrent задач выполняются одновременно, остальные ждут своей очереди.
+    - Длительность и результат (или ошибка) каждого запуска пишутся в лог и доступны через stats().
+    """
+
+    def __init__(self, max_concurrent: int = 1):
+        self.jobs = {}  # name -> Job
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self._tasks = set()
+
+    def add(self, name: str, func, interval: float, jitter: float = 0.1):
+        self.jobs[name] = Job(name, func, interval, jitter)
+
+    def run_now(self, name: str) -> bool:
+        """Запускает задачу вне расписания. False - задача уже выполняется."""
+        job = self.jobs[name]
+        if job.running:
+            job.metrics["skipped"] += 1
+            logging.warning(f"[Scheduler] Job {name} is still running, skipped")
+            return False
+        job.running = True  # Занимаем задачу сразу, ещё до ожидания семафора
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, job: Job):
+        try:
+            async with self.semaphore:
+                job.last_started = time.time()
+                started = time.monotonic()
+                try:
+                    job.last_result = await job.func()
+                    job.last_error = None
+                    job.metrics["runs"] += 1
+                except Exception as err:
+                    job.last_error = str(err)
+                    job.metrics["errors"] += 1
+                    logging.error(f"[Scheduler] Job {job.name} failed: {err}", exc_info=True)
+                job.last_duration = time.monotonic() - started
+                logging.info(f"[Scheduler] Job {job.name} took {job.last_duration * 1000:.0f} ms, "
+                             f"result: {job.last_result if job.last_error is None else job.last_error}")
+        finally:
+            job.running = False
+
+    async def _loop(self, job: Job):
+        while True:
+            await asyncio.sleep(job.next_delay())
+            self.run_now(job.name)
+
+    async def run(self):
+        """Запускает расписание всех задач, пока задача не будет отменена (выполняющиеся запуски тоже отменяются)."""
+        try:
+            await asyncio.gather(*(self._loop(job) for job in self.jobs.values()))
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {name: job.stats() for name, job in self.jobs.items()}
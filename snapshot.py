@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+
+MAGIC = b"KBS\x00"  # Kino Bot Snapshot
+VERSION = 1
+HEADER = struct.Struct(">4sH32s")  # magic, version, sha256 от сжатых данных
+
+
+class SnapshotError(Exception):
+    """Снимок повреждён, другой версии или не читается."""
+
+
+class SnapshotManager:
+    """
+    Снимки кэшей процесса для тёплого старта.
+
+    Каждый кэш регистрируется под именем парой функций dump() -> state и load(state, elapsed).
+    Снимок пишется атомарно (временный файл + os.replace) в формате:
+    заголовок (magic, версия, sha256) + zlib(pickle({"created_at", "sections"})).
+    Если файл отсутствует, повреждён или другой версии, бот просто стартует с пустыми кэшами.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sections = {}  # name -> (dump, load)
+
+    def register(self, name: str, dump, load):
+        self.sections[name] = (dump, load)
+
+    def collect(self) -> dict:
+        """Снимает состояние всех зарегистрированных кэшей (выполняется в event loop)."""
+        state = {}
+        for name, (dump, _) in self.sections.items():
+            try:
+                state[name] = dump()
+            except Exception as err:
+                logging.error(f"[Snapshot] Error dumping section {name}: {err}")
+        return {"created_at": time.time(), "sections": state}
+
+    @staticmethod
+    def encode(snapshot: dict) -> bytes:
+        payload = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+        return HEADER.pack(MAGIC, VERSION, hashlib.sha256(payload).digest()) + payload
+
+    @staticmethod
+    def decode(raw: bytes) -> dict:
+        if len(raw) < HEADER.size:
+            raise SnapshotError("file is too short")
+        magic, version, checksum = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise SnapshotError("bad magic")
+        if version != VERSION:
+            raise SnapshotError(f"unsupported version {version}")
+        payload = raw[HEADER.size:]
+        if hashlib.sha256(payload).digest() != checksum:
+            raise SnapshotError("checksum mismatch")
+        return pickle.loads(zlib.decompress(payload))
+
+    def save(self) -> int:
+        """Записывает снимок на диск, возвращает размер в байтах."""
+        raw = self.encode(self.collect())
+        self._write(raw)
+        return len(raw)
+
+    def load(self) -> bool:
+        """Загружает снимок, если он есть и корректен. False - холодный старт."""
+        if not os.path.exists(self.path):
+            logging.info(f"[Snapshot] {self.path} not found, cold start")
+            return False
+        try:
+            with open(self.path, "rb") as file:
+                snapshot = self.decode(file.read())
+        except Exception as err:
+            logging.warning(f"[Snapshot] {self.path} is unusable ({err}), cold start")
+            return False
+
+        elapsed = max(0.0, time.time() - snapshot["created_at"])
+        for name, state in snapshot["sections"].items():
+            if name not in self.sections:
+                continue
+            try:
+                self.sections[name][1](state, elapsed)
+            except Exception as err:
+                logging.error(f"[Snapshot] Error loading section {name}: {err}")
+        logging.info(f"[Snapshot] Loaded {len(snapshot['sections'])} sections from {self.path}, "
+                     f"age {elapsed:.0f} s")
+        return True
+
+    async def save_async(self):
+        """Снимает состояние в event loop, а сериализацию и запись на диск делает в отдельном потоке."""
+        try:
+            snapshot = self.collect()
+            raw = await asyncio.to_thread(self.encode, snapshot)
+            await asyncio.to_thread(self._write, raw)
+            logging.info(f"[Snapshot] Saved {len(raw)} bytes to {self.path}")
+        except Exception as err:
+            logging.error(f"[Snapshot] Error saving {self.path}: {err}")
+
+    def _write(self, raw: bytes):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def run_periodic(self, interval: float):
+        """Периодически сохраняет снимок, пока задача не будет отменена."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save_async()
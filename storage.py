@@ -0,0 +1,491 @@
+import asyncio
+import copy
+import functools
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import env_config
+
+
+class BaseStorage(ABC):
+    """
+    Общий асинхронный интерфейс хранилища пользователей.
+
+    Повторяет все методы database.Database, но в виде корутин, чтобы драйверы
+    (SQLite, память, PostgreSQL) можно было подменять через env_config.STORAGE_BACKEND.
+    Драйвер, в котором не реализован какой-то из абстрактных методов, не создаётся (TypeError).
+
+    scoped(scope) возвращает представление того же хранилища (общие соединения) с отдельной
+    таблицей пользователей и отдельными file_id - так несколько ботов в одном процессе не смешивают данные.
+    """
+
+    scope = ""
+
+    @property
+    def users_table(self) -> str:
+        return f"users_{self.scope}" if self.scope else "users"
+
+    def file_kind(self, kind: str) -> str:
+        return f"{self.scope}:{kind}" if self.scope else kind
+
+    def scoped(self, scope: str):
+        """Копия хранилища для бота scope (только буквы, цифры и _), использующая те же соединения."""
+        if not scope.replace("_", "").isalnum():
+            raise ValueError(f"Invalid storage scope: {scope}")
+        clone = copy.copy(self)
+        clone.scope = scope
+        return clone
+
+    async def connect(self):
+        """Open connections / pools. Called once before polling starts."""
+        return None
+
+    async def close(self):
+        """Release connections / pools."""
+        return None
+
+    @abstractmethod
+    async def create_table(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_user(self, user_id: int, group_id: int, username: str, custom_name: str = None,
+                       notify_watching: int = 0):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_user(self, user_id: int, group_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_notify_watching_status(self, user_id: int, group_id: int, notify_watching: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user_name(self, user_id: int, group_id: int) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_users(self, excluded_user_id: int, group_id: int, watching_only: int = 0) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_custom_name(self, user_id: int, group_id: int, custom_name: str = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_custom_name(self, user_id: int, group_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_file_id(self, kind: str, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_file_id(self, kind: str, key: str, file_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_file_id(self, kind: str, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_group_ids(self) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_group(self, group_id: int) -> int:
+        raise NotImplementedError
+
+    async def maintain(self) -> dict:
+        """Обслуживание хранилища (статистика планировщика, возврат свободного места)."""
+        return {}
+
+    @abstractmethod
+    async def add_poll(self, poll_id: str, chat_id: int, message_id: int, question: str, options: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_poll(self, poll_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_last_poll_id(self, chat_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_poll_votes(self, votes: list) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_poll_votes(self, poll_id: str) -> list:
+        raise NotImplementedError
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Асинхронный драйвер SQLite.
+
+    Запросы database.Database выполняются в отдельном потоке с одним постоянным соединением,
+    поэтому event loop не блокируется, а порядок записей сохраняется.
+    """
+
+    def __init__(self, db_name='users.db'):
+        self.db = database.Database(db_name, persistent=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def scoped(self, scope: str):
+        clone = super().scoped(scope)
+        clone.db = self.db.scoped(clone.users_table)
+        return clone
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def close(self):
+        await self._run(self.db.close)
+        self._executor.shutdown(wait=True)
+
+    async def create_table(self):
+        await self._run(self.db.create_table)
+
+    async def add_user(self, user_id: int, group_id: int, username: str, custom_name: str = None,
+                       notify_watching: int = 0):
+        await self._run(self.db.add_user, user_id, group_id, username, custom_name, notify_watching)
+
+    async def delete_user(self, user_id: int, group_id: int):
+        await self._run(self.db.delete_user, user_id, group_id)
+
+    async def update_notify_watching_status(self, user_id: int, group_id: int, notify_watching: int) -> bool:
+        return await self._run(self.db.update_notify_watching_status, user_id, group_id, notify_watching)
+
+    async def get_user_name(self, user_id: int, group_id: int) -> str:
+        return await self._run(self.db.get_user_name, user_id, group_id)
+
+    async def get_users(self, excluded_user_id: int, group_id: int, watching_only: int = 0) -> list:
+        return await self._run(self.db.get_users, excluded_user_id, group_id, watching_only)
+
+    async def update_custom_name(self, user_id: int, group_id: int, custom_name: str = None):
+        await self._run(self.db.update_custom_name, user_id, group_id, custom_name)
+
+    async def get_custom_name(self, user_id: int, group_id: int):
+        return await self._run(self.db.get_custom_name, user_id, group_id)
+
+    async def get_file_id(self, kind: str, key: str):
+        return await self._run(self.db.get_file_id, self.file_kind(kind), key)
+
+    async def set_file_id(self, kind: str, key: str, file_id: str):
+        await self._run(self.db.set_file_id, self.file_kind(kind), key, file_id)
+
+    async def delete_file_id(self, kind: str, key: str):
+        await self._run(self.db.delete_file_id, self.file_kind(kind), key)
+
+    async def get_group_ids(self) -> list:
+        return await self._run(self.db.get_group_ids)
+
+    async def delete_group(self, group_id: int) -> int:
+        return await self._run(self.db.delete_group, group_id)
+
+    async def maintain(self) -> dict:
+        return await self._run(self.db.optimize)
+
+    async def add_poll(self, poll_id: str, chat_id: int, message_id: int, question: str, options: list):
+        await self._run(self.db.add_poll, poll_id, chat_id, message_id, question, options)
+
+    async def get_poll(self, poll_id: str):
+        return await self._run(self.db.get_poll, poll_id)
+
+    async def get_last_poll_id(self, chat_id: int):
+        return await self._run(self.db.get_last_poll_id, chat_id)
+
+    async def save_poll_votes(self, votes: list) -> bool:
+        return await self._run(self.db.save_poll_votes, votes)
+
+    async def get_poll_votes(self, poll_id: str) -> list:
+        return await self._run(self.db.get_poll_votes, poll_id)
+
+
+class MemoryStorage(BaseStorage):
+    """Хранилище в памяти процесса: для тестов и бенчмарков, данные теряются при перезапуске."""
+
+    def __init__(self):
+        self.tables = {}  # users_table -> {(user_id, group_id) -> {"username", "custom_name", "notify_watching"}}
+        self.file_ids = {}  # (kind, key) -> file_id
+        self.polls = {}  # poll_id -> (chat_id, message_id, question, options)
+        self.poll_votes = {}  # poll_id -> {user_id: (name, option_ids)}
+
+    @property
+    def users(self) -> dict:
+        return self.tables.setdefault(self.users_table, {})
+
+    async def create_table(self):
+        return None
+
+    async def add_user(self, user_id: int, group_id: int, username: str, custom_name: str = None,
+                       notify_watching: int = 0):
+        self.users.setdefault((user_id, group_id), {
+            "username": username,
+            "custom_name": custom_name,
+            "notify_watching": notify_watching
+        })
+
+    async def delete_user(self, user_id: int, group_id: int):
+        self.users.pop((user_id, group_id), None)
+
+    async def update_notify_watching_status(self, user_id: int, group_id: int, notify_watching: int) -> bool:
+        if user := self.users.get((user_id, group_id)):
+            user["notify_watching"] = notify_watching
+        return True
+
+    async def get_user_name(self, user_id: int, group_id: int) -> str:
+        if user := self.users.get((user_id, group_id)):
+            return database.format_user_mention(user_id, user["custom_name"], user["username"])
+        return str(user_id)
+
+    async def get_users(self, excluded_user_id: int, group_id: int, watching_only: int = 0) -> list:
+        return [
+            database.format_user_mention(user_id, user["custom_name"], user["username"])
+            for (user_id, user_group_id), user in self.users.items()
+            if user_group_id == group_id and user_id != excluded_user_id
+            and (not watching_only or user["notify_watching"] == 1)
+        ]
+
+    async def update_custom_name(self, user_id: int, group_id: int, custom_name: str = None):
+        if user := self.users.get((user_id, group_id)):
+            user["custom_name"] = custom_name
+
+    async def get_custom_name(self, user_id: int, group_id: int):
+        user = self.users.get((user_id, group_id))
+        return user["custom_name"] if user and user["custom_name"] else None
+
+    async def get_file_id(self, kind: str, key: str):
+        return self.file_ids.get((self.file_kind(kind), key))
+
+    async def set_file_id(self, kind: str, key: str, file_id: str):
+        self.file_ids[(self.file_kind(kind), key)] = file_id
+
+    async def delete_file_id(self, kind: str, key: str):
+        self.file_ids.pop((self.file_kind(kind), key), None)
+
+    async def get_group_ids(self) -> list:
+        return list({group_id for _, group_id in self.users})
+
+    async def delete_group(self, group_id: int) -> int:
+        members = [member for member in self.users if member[1] == group_id]
+        for member in members:
+            del self.users[member]
+        return len(members)
+
+    async def add_poll(self, poll_id: str, chat_id: int, message_id: int, question: str, options: list):
+        self.polls[poll_id] = (chat_id, message_id, question, list(options))
+
+    async def get_poll(self, poll_id: str):
+        return self.polls.get(poll_id)
+
+    async def get_last_poll_id(self, chat_id: int):
+        return next((poll_id for poll_id, poll in reversed(self.polls.items()) if poll[0] == chat_id), None)
+
+    async def save_poll_votes(self, votes: list) -> bool:
+        for poll_id, user_id, name, option_ids in votes:
+            if option_ids:
+                self.poll_votes.setdefault(poll_id, {})[user_id] = (name, tuple(option_ids))
+            else:
+                self.poll_votes.get(poll_id, {}).pop(user_id, None)
+        return True
+
+    async def get_poll_votes(self, poll_id: str) -> list:
+        return [(user_id, name, option_ids) for user_id, (name, option_ids) in self.poll_votes.get(poll_id, {}).items()]
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Драйвер PostgreSQL на asyncpg.
+
+    Соединения берутся из пула, а asyncpg кэширует подготовленные (prepared) запросы
+    на каждом соединении, так что повторные запросы не разбираются сервером заново.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._shared = {"pool": None}  # Общий для scoped-копий пул соединений
+
+    @property
+    def pool(self):
+        return self._shared["pool"]
+
+    async def connect(self):
+        import asyncpg  # Необязательная зависимость, нужна только для PostgreSQL
+
+        if self.pool is None:
+            self._shared["pool"] = await asyncpg.create_pool(
+                self.dsn, min_size=self.min_size, max_size=self.max_size, statement_cache_size=256
+            )
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self._shared["pool"] = None
+
+    async def create_table(self):
+        await self.pool.execute(f'''CREATE TABLE IF NOT EXISTS {self.users_table} (
+                                       user_id BIGINT,
+                                       group_id BIGINT,
+                                       username TEXT,
+                                       custom_name TEXT,
+                                       notify_watching INTEGER DEFAULT 0,
+                                       PRIMARY KEY (user_id, group_id)
+                                   )''')
+        await self.pool.execute('''CREATE TABLE IF NOT EXISTS file_ids (
+                                       kind TEXT,
+                                       key TEXT,
+                                       file_id TEXT NOT NULL,
+                                       PRIMARY KEY (kind, key)
+                                   )''')
+        await self.pool.execute('''CREATE TABLE IF NOT EXISTS polls (
+                                       poll_id TEXT PRIMARY KEY,
+                                       chat_id BIGINT,
+                                       message_id BIGINT,
+                                       question TEXT,
+                                       options TEXT[],
+                                       created_at TIMESTAMPTZ DEFAULT now()
+                                   )''')
+        await self.pool.execute('''CREATE TABLE IF NOT EXISTS poll_votes (
+                                       poll_id TEXT,
+                                       user_id BIGINT,
+                                       name TEXT,
+                                       option_ids INTEGER[],
+                                       PRIMARY KEY (poll_id, user_id)
+                                   )''')
+        await self.pool.execute('CREATE INDEX IF NOT EXISTS polls_chat_id ON polls (chat_id, created_at)')
+
+    async def add_user(self, user_id: int, group_id: int, username: str, custom_name: str = None,
+                       notify_watching: int = 0):
+        await self.pool.execute(
+            f'''INSERT INTO {self.users_table} (user_id, group_id, username, custom_name, notify_watching)
+               VALUES ($1, $2, $3, $4, $5) ON CONFLICT DO NOTHING''',
+            user_id, group_id, username, custom_name, notify_watching
+        )
+
+    async def delete_user(self, user_id: int, group_id: int):
+        await self.pool.execute(f'DELETE FROM {self.users_table} WHERE user_id = $1 AND group_id = $2', user_id, group_id)
+
+    async def update_notify_watching_status(self, user_id: int, group_id: int, notify_watching: int) -> bool:
+        try:
+            await self.pool.execute(
+                f'UPDATE {self.users_table} SET notify_watching = $1 WHERE user_id = $2 AND group_id = $3',
+                notify_watching, user_id, group_id
+            )
+            return True
+        except Exception as err:
+            logging.error(f"[PostgresStorage] update_notify_watching_status error: {err}")
+            return False
+
+    async def get_user_name(self, user_id: int, group_id: int) -> str:
+        user = await self.pool.fetchrow(
+            f'SELECT user_id, custom_name, username FROM {self.users_table} WHERE user_id = $1 AND group_id = $2',
+            user_id, group_id
+        )
+        if user:
+            return database.format_user_mention(*user)
+        return str(user_id)
+
+    async def get_users(self, excluded_user_id: int, group_id: int, watching_only: int = 0) -> list:
+        query = f'SELECT user_id, custom_name, username FROM {self.users_table} WHERE user_id != $1 AND group_id = $2'
+        if watching_only:
+            query += ' AND notify_watching = 1'
+
+        users = await self.pool.fetch(query, excluded_user_id, group_id)
+        return [database.format_user_mention(*user) for user in users]
+
+    async def update_custom_name(self, user_id: int, group_id: int, custom_name: str = None):
+        await self.pool.execute(
+            f'UPDATE {self.users_table} SET custom_name = $1 WHERE user_id = $2 AND group_id = $3',
+            custom_name, user_id, group_id
+        )
+
+    async def get_custom_name(self, user_id: int, group_id: int):
+        result = await self.pool.fetchval(
+            f'SELECT custom_name FROM {self.users_table} WHERE user_id = $1 AND group_id = $2', user_id, group_id
+        )
+        return result if result else None
+
+    async def get_file_id(self, kind: str, key: str):
+        return await self.pool.fetchval('SELECT file_id FROM file_ids WHERE kind = $1 AND key = $2',
+                                        self.file_kind(kind), key)
+
+    async def set_file_id(self, kind: str, key: str, file_id: str):
+        await self.pool.execute(
+            '''INSERT INTO file_ids (kind, key, file_id) VALUES ($1, $2, $3)
+               ON CONFLICT (kind, key) DO UPDATE SET file_id = EXCLUDED.file_id''',
+            self.file_kind(kind), key, file_id
+        )
+
+    async def delete_file_id(self, kind: str, key: str):
+        await self.pool.execute('DELETE FROM file_ids WHERE kind = $1 AND key = $2', self.file_kind(kind), key)
+
+    async def get_group_ids(self) -> list:
+        groups = await self.pool.fetch(f'SELECT DISTINCT group_id FROM {self.users_table}')
+        return [group_id for group_id, in groups]
+
+    async def delete_group(self, group_id: int) -> int:
+        status = await self.pool.execute(f'DELETE FROM {self.users_table} WHERE group_id = $1', group_id)
+        return int(status.split()[-1])  # "DELETE <n>"
+
+    async def maintain(self) -> dict:
+        # Место освобождает autovacuum сервера, здесь только обновляется статистика планировщика
+        await self.pool.execute(f'ANALYZE {self.users_table}, file_ids, polls, poll_votes')
+        return {}
+
+    async def add_poll(self, poll_id: str, chat_id: int, message_id: int, question: str, options: list):
+        await self.pool.execute(
+            '''INSERT INTO polls (poll_id, chat_id, message_id, question, options) VALUES ($1, $2, $3, $4, $5)
+               ON CONFLICT (poll_id) DO NOTHING''',
+            poll_id, chat_id, message_id, question, list(options)
+        )
+
+    async def get_poll(self, poll_id: str):
+        poll = await self.pool.fetchrow(
+            'SELECT chat_id, message_id, question, options FROM polls WHERE poll_id = $1', poll_id
+        )
+        return (poll[0], poll[1], poll[2], list(poll[3])) if poll else None
+
+    async def get_last_poll_id(self, chat_id: int):
+        return await self.pool.fetchval(
+            'SELECT poll_id FROM polls WHERE chat_id = $1 ORDER BY created_at DESC LIMIT 1', chat_id
+        )
+
+    async def save_poll_votes(self, votes: list) -> bool:
+        saved = [(poll_id, user_id, name, list(option_ids)) for poll_id, user_id, name, option_ids in votes if option_ids]
+        retracted = [(poll_id, user_id) for poll_id, user_id, _, option_ids in votes if not option_ids]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if saved:
+                    await conn.executemany(
+                        '''INSERT INTO poll_votes (poll_id, user_id, name, option_ids) VALUES ($1, $2, $3, $4)
+                           ON CONFLICT (poll_id, user_id) DO UPDATE SET name = EXCLUDED.name, option_ids = EXCLUDED.option_ids''',
+                        saved
+                    )
+                if retracted:
+                    await conn.executemany('DELETE FROM poll_votes WHERE poll_id = $1 AND user_id = $2', retracted)
+        return True
+
+    async def get_poll_votes(self, poll_id: str) -> list:
+        votes = await self.pool.fetch('SELECT user_id, name, option_ids FROM poll_votes WHERE poll_id = $1', poll_id)
+        return [(user_id, name, tuple(option_ids)) for user_id, name, option_ids in votes]
+
+
+def create_storage(backend: str = None) -> BaseStorage:
+    """Создаёт драйвер хранилища по имени (sqlite, memory, postgres), по умолчанию из env_config."""
+    backend = (backend or env_config.STORAGE_BACKEND).lower()
+    if backend == "sqlite":
+        return SQLiteStorage(env_config.SQLITE_PATH)
+    elif backend == "memory":
+        return MemoryStorage()
+    elif backend in ("postgres", "postgresql"):
+        return PostgresStorage(env_config.POSTGRES_DSN, env_config.POSTGRES_POOL_MIN, env_config.POSTGRES_POOL_MAX)
+    raise ValueError(f"Unknown storage backend: {backend}")
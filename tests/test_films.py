@@ -0,0 +1,59 @@
+import asyncio
+
+import algorithm
+import recommend
+from commands import parse_command
+
+
+class FakeChat:
+    id = -100
+
+
+class FakeMessage:
+    chat = FakeChat()
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def run_films(monkeypatch, text, total, history=None):
+    """Выполняет /films с подменённым API (в фильтре total фильмов с id от 1) и возвращает (ответы, страницы)."""
+    pages = []
+
+    async def fetch_movie_data(url, cacheable=False):
+        page = int(url.rsplit("page=", 1)[1])
+        pages.append(page)
+        size = int(url.split("limit=", 1)[1].split("&", 1)[0])
+        ids = range((page - 1) * size + 1, min(page * size, total) + 1)
+        return {"total": total, "docs": [{"id": movie_id, "name": f"Фильм {movie_id}"} for movie_id in ids]}
+
+    monkeypatch.setattr(algorithm, "fetch_movie_data", fetch_movie_data)
+    monkeypatch.setattr(algorithm, "films_totals", algorithm.TTLCache(maxsize=10))
+    message = FakeMessage()
+    asyncio.run(algorithm.handle_films_command(message, parse_command(text), history))
+    return message.replies, pages
+
+
+def test_films_tops_up_from_seen_movies(monkeypatch):
+    history = recommend.HistoryStore()
+    history.get(FakeChat.id).add([{"id": movie_id} for movie_id in range(1, 30)])
+
+    replies, pages = run_films(monkeypatch, "/films x5", total=30, history=history)
+
+    assert pages[-1] == 1  # Единственная полная страница
+    assert replies[0].count("Фильм ") == 5
+    assert "Фильм 30" in replies[0]  # Единственный непросмотренный фильм попадает в ответ
+
+
+def test_films_first_page_is_random_and_refetched_when_out_of_range(monkeypatch):
+    monkeypatch.setattr(algorithm.env_config, "FILMS_FIRST_PAGES", 5)
+    monkeypatch.setattr(algorithm.random, "randint", lambda low, high: high)
+
+    replies, pages = run_films(monkeypatch, "/films", total=65, history=None)
+
+    # Сначала страница 5 из первых FILMS_FIRST_PAGES, затем последняя полная страница по total
+    assert pages == [5, 2]
+    assert replies[0].count("Фильм ") == algorithm.FILMS_DEFAULT
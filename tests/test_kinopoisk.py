@@ -0,0 +1,168 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import kinopoisk
+
+
+class FakeResponse:
+    def __init__(self, status: int, data):
+        self.status = status
+        self.data = data
+        self.headers = {"Content-Type": "application/json"}
+
+    async def json(self):
+        return self.data
+
+
+class FakeRequest:
+    def __init__(self, session, delay: float, status: int, data):
+        self.session = session
+        self.delay = delay
+        self.response = FakeResponse(status, data)
+
+    async def __aenter__(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.session.cancelled += 1
+            raise
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    """Сессия aiohttp, отвечающая по очереди ответами replies: (задержка, статус, данные)."""
+
+    def __init__(self, replies: list):
+        self.replies = list(replies)
+        self.requests = 0
+        self.cancelled = 0
+
+    def get(self, url, headers=None):
+        delay, status, data = self.replies[min(self.requests, len(self.replies) - 1)]
+        self.requests += 1
+        return FakeRequest(self, delay, status, data)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(kinopoisk.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_and_closes_after_probe(clock):
+    breaker = kinopoisk.CircuitBreaker("test", failure_rate=0.5, window=10, min_calls=4, open_seconds=30)
+    for success in (True, False, False, True):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()  # Единственный пробный запрос
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()  # Пока проба не завершилась, остальные отклоняются
+
+    breaker.record(True)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+    assert breaker.metrics == Counter({"breaker_open": 1, "breaker_half_open": 1, "breaker_closed": 1})
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = kinopoisk.CircuitBreaker("test", min_calls=2, open_seconds=30)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(False)
+    assert breaker.state == breaker.OPEN
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_breaker_lost_probe_is_retried_after_open_seconds(clock):
+    breaker = kinopoisk.CircuitBreaker("test", min_calls=1, open_seconds=30)
+    breaker.allow()
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.allow()  # Проба отменена и record() не вызван
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_latency_percentile():
+    tracker = kinopoisk.LatencyTracker(size=100)
+    assert tracker.percentile(0.95) is None
+    for value in range(1, 201):
+        tracker.add(value / 1000)
+
+    # В окне только последние 100 значений: 0.101 .. 0.200
+    assert tracker.percentile(0.95) == pytest.approx(0.196)
+    assert tracker.percentile(0.0) == pytest.approx(0.101)
+
+
+def test_hedged_request_wins_and_slow_one_is_cancelled():
+    session = FakeSession([(1.0, 200, {"id": "slow"}), (0.0, 200, {"id": "fast"})])
+    client = kinopoisk.KinopoiskClient("token", timeout=5, hedge_min_delay=0.02, session_factory=lambda: session)
+    client.latency.add(0.01)
+
+    async def main():
+        data = await client.fetch("https://api.example/movie")
+        await asyncio.sleep(0)  # Даём отменённому запросу обработать CancelledError
+        return data
+
+    assert asyncio.run(main()) == {"id": "fast"}
+    assert session.requests == 2
+    assert session.cancelled == 1
+    assert client.metrics["hedged"] == 1
+    assert client.breaker.state == client.breaker.CLOSED
+
+
+def test_timeout_serves_stale_response():
+    session = FakeSession([(1.0, 200, {"id": "new"})])
+    client = kinopoisk.KinopoiskClient("token", timeout=0.05, hedge=False, session_factory=lambda: session)
+    client.stale.set("https://api.example/movie", {"id": "old"})
+
+    assert asyncio.run(client.fetch("https://api.example/movie")) == {"id": "old"}
+    assert client.metrics["timeout"] == 1
+    assert client.metrics["fallback"] == 1
+    assert session.cancelled == 1
+
+
+def test_server_errors_open_breaker_and_short_circuit():
+    session = FakeSession([(0.0, 500, None)])
+    client = kinopoisk.KinopoiskClient("token", hedge=False, session_factory=lambda: session)
+
+    async def main():
+        for _ in range(client.breaker.min_calls + 1):
+            await client.fetch("https://api.example/movie")
+
+    asyncio.run(main())
+    assert client.breaker.state == client.breaker.OPEN
+    assert session.requests == client.breaker.min_calls
+    assert client.metrics["failure"] == client.breaker.min_calls
+    assert client.metrics["short_circuit"] == 1
@@ -0,0 +1,45 @@
+import asyncio
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramMigrateToChat, TelegramNetworkError
+from aiogram.methods import GetChatMember
+
+import maintenance
+import storage
+
+
+class FakeMember:
+    status = "member"
+
+
+class FakeBot:
+    """Бот, у которого -1 стала супергруппой, -2 недоступна по сети, из -3 бота удалили."""
+    id = 1
+
+    async def get_chat_member(self, chat_id, user_id):
+        method = GetChatMember(chat_id=chat_id, user_id=user_id)
+        if chat_id == -1:
+            raise TelegramMigrateToChat(method=method, message="migrated", migrate_to_chat_id=-1001)
+        if chat_id == -2:
+            raise TelegramNetworkError(method=method, message="timeout")
+        if chat_id == -3:
+            raise TelegramForbiddenError(method=method, message="bot was kicked")
+        return FakeMember()
+
+
+def test_prune_survives_migrated_and_unreachable_groups():
+    async def main():
+        db = storage.MemoryStorage()
+        await db.create_table()
+        for group_id in (-1, -2, -3, -4):
+            await db.add_user(5, group_id, "user")
+        pruner = maintenance.GroupPruner(limit=10, delay=0)
+        pruned = []
+
+        result = await pruner.prune(FakeBot(), db, pruned.append)
+
+        assert result == {"checked": 4, "groups": 2, "users": 2}
+        assert sorted(pruned) == [-3, -1]
+        assert sorted(await db.get_group_ids()) == [-4, -2]
+        assert pruner.cursors[FakeBot.id] == -1
+
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import asyncio
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import algorithm
+
+
+class FakeMessage:
+    def __init__(self, reply_markup):
+        self.reply_markup = reply_markup
+        self.replies = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def edit_reply_markup(self, reply_markup=None, **kwargs):
+        self.reply_markup = reply_markup
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, message):
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+def test_title_button_is_replaced_with_movie_id(monkeypatch):
+    searches = []
+
+    async def send_film_search(message, query, posters=None):
+        searches.append(query)
+        return {"id": 301, "name": query}
+
+    async def reply_movie(message, response, keyboard, movie, posters=None):
+        message.replies.append(movie["id"])
+
+    movie = {"id": 301, "name": "Матрица", "type": "movie", "year": 1999, "rating": {"kp": 8.5, "imdb": 8.7}}
+    monkeypatch.setattr(algorithm, "send_film_search", send_film_search)
+    monkeypatch.setattr(algorithm, "reply_movie", reply_movie)
+    algorithm.remember_movies([movie])
+
+    callback_data = algorithm.query_callback_data("Матрица")
+    assert callback_data == "/film Матрица"
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Матрица", callback_data=callback_data)]])
+    message = FakeMessage(markup)
+
+    asyncio.run(algorithm.handle_movie_callback(FakeCallbackQuery(callback_data, message)))
+    assert searches == ["Матрица"]
+    assert message.reply_markup.inline_keyboard[0][0].callback_data == "fm:301"
+    assert message.reply_markup.inline_keyboard[0][0].text == "Матрица"
+
+    # Следующие нажатия берут фильм по id из кэша, без поиска по названию
+    asyncio.run(algorithm.handle_movie_callback(FakeCallbackQuery("fm:301", message)))
+    assert searches == ["Матрица"]
+    assert message.replies == [301]
+
+
+def test_long_title_uses_short_key():
+    title = "Очень длинное название фильма, которое не помещается в callback_data"
+    callback_data = algorithm.query_callback_data(title)
+
+    assert callback_data.startswith("fq:")
+    assert len(callback_data.encode("utf-8")) <= algorithm.CALLBACK_DATA_MAX
+    assert algorithm.callback_titles.get(callback_data.removeprefix("fq:"))["title"] == title
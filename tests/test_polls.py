@@ -0,0 +1,32 @@
+import polls
+
+
+def make_state(voters: int, name_length: int) -> polls.PollState:
+    state = polls.PollState(-100, 1, "Что смотрим?", [f"Вариант {index}" for index in range(10)])
+    for user_id in range(voters):
+        state.apply(user_id, f"{user_id}" + "я" * name_length, tuple(range(10)))
+    return state
+
+
+def test_format_results_short():
+    state = make_state(3, 5)
+    text = state.format_results()
+    assert text.startswith("📊 Что смотрим?")
+    assert "Вариант 0 - 3 (100%)" in text
+    assert "Всего проголосовало: 3" in text
+
+
+def test_format_results_fits_telegram_limit():
+    # 10 вариантов по 15 имён из 64 символов - больше 9600 символов без ограничения
+    text = make_state(100, 64).format_results()
+    assert polls.telegram_length(text) <= polls.RESULTS_TEXT_MAX
+    assert "Вариант 9 - 100 (100%)" in text
+    assert "Всего проголосовало: 100" in text
+    assert "и ещё" in text
+
+
+def test_format_results_truncates_long_options():
+    state = polls.PollState(-100, 1, "😀" * 300, ["😀" * 500 for _ in range(10)])
+    text = state.format_results()
+    assert polls.telegram_length(text) <= polls.RESULTS_TEXT_MAX
+    assert text.endswith("…")
@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+
+import recommend
+
+
+def make_movie(movie_id: int, genres=("драма",), countries=("США",), rating=7.0, year=2000) -> dict:
+    return {
+        "id": movie_id,
+        "genres": [{"name": name} for name in genres],
+        "countries": [{"name": name} for name in countries],
+        "rating": {"kp": rating},
+        "year": year
+    }
+
+
+def dense(features: recommend.MovieFeatures) -> np.ndarray:
+    matrix = np.zeros((len(features), recommend.FEATURES), dtype=np.float32)
+    matrix[features.rows, features.columns] = 1.0
+    matrix[:, recommend.RATING_COLUMN] = features.ratings
+    matrix[:, recommend.YEAR_COLUMN] = features.years
+    return matrix
+
+
+def test_bloom_filter():
+    bloom = recommend.BloomFilter(8192)
+    added = random.Random(1).sample(range(1, 10_000_000), 500)
+    for movie_id in added:
+        bloom.add(movie_id)
+
+    assert all(movie_id in bloom for movie_id in added)  # Ложноотрицательных ответов нет
+    others = [movie_id for movie_id in range(10_000_001, 10_002_001)]
+    assert sum(movie_id in bloom for movie_id in others) < 50  # Ложноположительных - немного
+
+    ids = np.array(added + others, dtype=np.int64)
+    assert bloom.contains_many(ids).tolist() == [movie_id in bloom for movie_id in added + others]
+
+
+def test_score_matches_dense_cosine():
+    rng = random.Random(2)
+    genres, countries = sorted(recommend.GENRE_INDEX), sorted(recommend.COUNTRY_INDEX)
+    movies = [make_movie(movie_id, rng.sample(genres, rng.randint(0, 3)), rng.sample(countries, rng.randint(0, 2)),
+                         rng.uniform(0, 10), rng.randint(1900, 2025)) for movie_id in range(1, 201)]
+    features = recommend.movie_features(movies)
+    profile = features.profile()[::-1].copy()
+    matrix = dense(features)
+
+    assert np.allclose(features.profile(), matrix.sum(axis=0), rtol=1e-4)
+    expected = (matrix @ profile) / np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(profile), 1e-9)
+    assert np.allclose(recommend.score(features, profile), expected, atol=1e-5)
+
+
+def test_recommend_prefers_chat_taste_and_skips_seen():
+    store = recommend.HistoryStore()
+    store.get(1).add([make_movie(movie_id, ("аниме",), ("Япония",)) for movie_id in range(1, 11)])
+    candidates = [make_movie(movie_id, ("аниме",), ("Япония",)) for movie_id in range(1, 11)]  # Уже предлагались
+    candidates += [make_movie(100 + movie_id, ("вестерн",), ("США",)) for movie_id in range(20)]
+    candidates += [make_movie(200, ("аниме",), ("Япония",))]
+
+    assert store.recommend(1, candidates, top=1)["id"] == 200
+    features = recommend.movie_features(candidates)
+    assert store.recommend(1, candidates, top=1, features=features)["id"] == 200
+    assert store.recommend(1, candidates[:10]) is None  # Все кандидаты уже предлагались
+
+
+def test_recommend_without_history_picks_any_candidate():
+    store = recommend.HistoryStore()
+    candidates = [make_movie(movie_id) for movie_id in range(1, 6)]
+
+    assert store.recommend(1, candidates) in candidates
+    assert store.recommend(1, []) is None
@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+import throttling
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttling.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_callback(data: str) -> CallbackQuery:
+    user = User(id=1, is_bot=False, first_name="user")
+    message = Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=-100, type="group"))
+    return CallbackQuery(id="1", from_user=user, chat_instance="1", message=message, data=data)
+
+
+def test_window_limit_and_sliding():
+    counter = throttling.SlidingWindowCounter()
+    for now in (0, 1, 2):
+        assert counter.allows("key", 3, 10, now)
+        counter.record("key", 3, now)
+    assert not counter.allows("key", 3, 10, 9.9)
+    assert counter.allows("key", 3, 10, 10)  # Первое событие вышло из окна
+
+
+def test_evict_removes_only_idle_keys():
+    counter = throttling.SlidingWindowCounter()
+    counter.record("old", 3, 0)
+    counter.record("active", 3, 1)
+    counter.record("old_again", 3, 2)
+    counter.record("active", 3, 50)
+
+    assert counter.evict(older_than=40) == 2
+    assert list(counter.windows) == ["active"]
+
+
+def test_chat_limit_does_not_charge_user(clock):
+    middleware = throttling.ThrottlingMiddleware({"film": (2, 3, 60)})
+    # Другие пользователи исчерпали лимит чата
+    for user_id in (10, 11, 12):
+        assert middleware.allow("film", user_id, -100)
+
+    assert not middleware.allow("film", 1, -100)
+    assert not middleware.allow("film", 1, -100)
+    # В другом чате лимит пользователя не израсходован отклонёнными вызовами
+    assert middleware.allow("film", 1, -200)
+    assert middleware.allow("film", 1, -200)
+    assert not middleware.allow("film", 1, -200)
+
+
+def test_allow_evicts_idle_windows(clock):
+    middleware = throttling.ThrottlingMiddleware({"film": (2, 3, 60)})
+    middleware.allow("film", 1, -100)
+    assert len(middleware.counter) == 2
+
+    clock[0] += 61
+    middleware.allow("film", 2, -200)
+    assert len(middleware.counter) == 2  # Окна пользователя 1 и чата -100 удалены
+
+
+def test_callback_families():
+    assert throttling.ThrottlingMiddleware.get_family(make_callback("fp:abc:2")) is None  # Листание не ограничивается
+    assert throttling.ThrottlingMiddleware.get_family(make_callback("fm:301")) == "film"
+    assert throttling.ThrottlingMiddleware.get_family(make_callback("fq:key")) == "film"
+    assert throttling.ThrottlingMiddleware.get_family(make_callback("/film Матрица")) == "film"
+
+
+def test_parse_limits():
+    assert throttling.parse_limits("film=3:10/30, gif=5:20/60") == {"film": (3, 10, 30.0), "gif": (5, 20, 60.0)}
@@ -0,0 +1,135 @@
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from commands import ParsedCommand, parse_command
+
+# Семейства команд: какие команды и кнопки делят один лимит
+COMMAND_FAMILIES = {
+    "film": {"film", "films", "filmr"},
+    "gif": {"gif"},
+    "mentions": {"everyone", "watching"},
+    "polls": {"vote", "poll"},
+}
+# Листание /film (fp:) не обращается к API, поэтому не ограничивается
+CALLBACK_FAMILIES = {
+    "fm": "film", "fq": "film", "/film": "film",
+}
+
+
+def parse_limits(spec: str) -> dict:
+    """
+    Разбирает строку лимитов вида "film=3:10/30,gif=5:20/60".
+
+    Для каждого семейства: лимит на пользователя : лимит на чат / окно в секундах.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        family, rule = item.split("=")
+        counts, window = rule.split("/")
+        user_limit, chat_limit = counts.split(":")
+        limits[family.strip()] = (int(user_limit), int(chat_limit), float(window))
+    return limits
+
+
+class SlidingWindowCounter:
+    """
+    Скользящие окна для множества ключей.
+
+    На ключ хранится deque не длиннее лимита с временами последних срабатываний, поэтому память
+    ограничена лимитом. Ключи, не использовавшиеся дольше окна, удаляются (в порядке давности).
+    """
+
+    def __init__(self):
+        self.windows = OrderedDict()  # key -> deque(timestamps)
+
+    def allows(self, key, limit: int, window: float, now: float) -> bool:
+        """Есть ли место для события в окне ключа (событие не учитывается)."""
+        timestamps = self.windows.get(key)
+        return timestamps is None or len(timestamps) < limit or now - timestamps[0] >= window
+
+    def record(self, key, limit: int, now: float):
+        """Учитывает событие без проверки лимита."""
+        timestamps = self.windows.get(key)
+        if timestamps is None:
+            timestamps = self.windows[key] = deque(maxlen=limit)
+        timestamps.append(now)
+        self.windows.move_to_end(key)
+
+    def evict(self, older_than: float) -> int:
+        """Удаляет ключи без событий после older_than и возвращает их количество."""
+        evicted = 0
+        while self.windows:
+            key, timestamps = next(iter(self.windows.items()))
+            if timestamps and timestamps[-1] >= older_than:
+                break
+            del self.windows[key]
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self.windows)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Анти-флуд: ограничивает частоту команд по семействам на пользователя и на чат.
+
+    Регистрируется как outer-middleware, поэтому лишние вызовы отбрасываются молча
+    до фильтров, обращений к БД и HTTP-запросов.
+    """
+
+    def __init__(self, limits: dict):
+        self.limits = limits  # family -> (user_limit, chat_limit, window)
+        self.counter = SlidingWindowCounter()
+        self.max_window = max((window for _, _, window in limits.values()), default=0)
+        self.last_eviction = time.monotonic()
+        self.metrics = Counter()
+
+    @staticmethod
+    def get_family(event, parsed: ParsedCommand = None):
+        if isinstance(event, Message):
+            parsed = parsed or parse_command(event.text)
+            if parsed.command:
+                command = parsed.command.lower()
+                for family, commands in COMMAND_FAMILIES.items():
+                    if command in commands:
+                        return family
+            elif "@all" in parsed.args:
+                return "mentions"
+        elif isinstance(event, CallbackQuery) and event.data:
+            return CALLBACK_FAMILIES.get(event.data.split(":", 1)[0].split(" ", 1)[0])
+        return None
+
+    def allow(self, family: str, user_id: int, chat_id: int) -> bool:
+        user_limit, chat_limit, window = self.limits[family]
+        now = time.monotonic()
+        if now - self.last_eviction > self.max_window:
+            self.counter.evict(now - self.max_window)
+            self.last_eviction = now
+
+        # Событие учитывается в обоих окнах, только если проходит оба: отклонённый по лимиту чата вызов
+        # не расходует лимит пользователя
+        user_key, chat_key = (family, "u", user_id), (family, "c", chat_id)
+        if not (self.counter.allows(user_key, user_limit, window, now) and
+                self.counter.allows(chat_key, chat_limit, window, now)):
+            return False
+        self.counter.record(user_key, user_limit, now)
+        self.counter.record(chat_key, chat_limit, now)
+        return True
+
+    async def __call__(self, handler, event, data):
+        family = self.get_family(event, data.get("parsed"))
+        if family in self.limits and event.from_user:
+            chat = event.chat if isinstance(event, Message) else (event.message.chat if event.message else None)
+            chat_id = chat.id if chat else event.from_user.id
+            if not self.allow(family, event.from_user.id, chat_id):
+                self.metrics[family] += 1
+                logging.debug(f"[Throttling] Dropped {family} from {event.from_user.id} in {chat_id}")
+                if isinstance(event, CallbackQuery):
+                    await event.answer()
+                return None
+        return await handler(event, data)